@@ -7,4 +7,4 @@ with Neo4j integration.
 
 __version__ = "0.2.0"
 __author__ = "Alan Shum"
-__all__ = ["server"]
+__all__ = ["journal", "server", "shim"]
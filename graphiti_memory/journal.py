@@ -0,0 +1,131 @@
+"""
+Graphiti-Memory episode journal
+
+An append-only SQLite log of accepted add_memory episodes, so queued work
+survives a crash or restart. Each episode is recorded before add_memory
+answers, marked done (or failed) once the queue worker has processed it, and
+every entry still pending at startup is replayed.
+
+All SQLite work happens on one dedicated thread. Writes that arrive while a
+commit is in progress are grouped into the next transaction, so many
+concurrent add_memory calls share a single fsync instead of paying one each.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class EpisodeJournal:
+    """Write-ahead journal for queued episodes, backed by a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="episode-journal")
+        self._pending = []
+        self._flusher = None
+
+    async def open(self):
+        """Open the journal and return [(id, payload)] for entries still pending."""
+        return await self._call(self._open)
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(SCHEMA)
+        # Processed entries are only kept until the next start
+        self._db.execute("DELETE FROM episodes WHERE state = 'done'")
+        rows = self._db.execute(
+            "SELECT id, payload FROM episodes WHERE state = 'pending' ORDER BY id"
+        ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    async def append(self, group_id, payload):
+        """Record an accepted episode and return its id once it is on disk.
+
+        If the caller is cancelled while waiting, the entry may still be
+        committed; it is then replayed at the next start, which at-least-once
+        delivery allows.
+        """
+        now = time.time()
+        return await self._write(
+            "INSERT INTO episodes (group_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (group_id, json.dumps(payload, ensure_ascii=False), now, now),
+        )
+
+    async def mark_done(self, entry_id):
+        """Mark an entry as processed, so it is not replayed."""
+        await self._write(
+            "UPDATE episodes SET state = 'done', updated_at = ? WHERE id = ?",
+            (time.time(), entry_id),
+        )
+
+    async def mark_failed(self, entry_id, error):
+        """Mark an entry as failed; failed entries are kept but not replayed."""
+        await self._write(
+            "UPDATE episodes SET state = 'failed', error = ?, updated_at = ? WHERE id = ?",
+            (str(error), time.time(), entry_id),
+        )
+
+    async def close(self):
+        """Commit outstanding writes and close the database."""
+        if self._flusher is not None:
+            await self._flusher
+        await self._call(self._db.close)
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _write(self, sql, params):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((sql, params, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        # Whatever queued up during one commit goes out together in the next
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                row_ids = await self._call(self._commit, [(sql, params) for sql, params, _ in batch])
+            except Exception as e:
+                logger.error(f"Episode journal write failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), row_id in zip(batch, row_ids):
+                if not future.done():
+                    future.set_result(row_id)
+
+    def _commit(self, statements):
+        row_ids = []
+        self._db.execute("BEGIN")
+        try:
+            for sql, params in statements:
+                row_ids.append(self._db.execute(sql, params).lastrowid)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return row_ids
@@ -21,14 +21,31 @@ Environment Variables Required:
 Usage:
     This server is designed to be run via any MCP client (Claude Desktop, Cline, etc.).
     Configure in your MCP client config with appropriate environment variables.
+    Run with --transport http to serve many clients from a single process.
 """
+import argparse
 import asyncio
+import functools
+import hashlib
 import json
 import sys
 import logging
 import os
-from datetime import datetime, timezone
+import random
+import signal
+import stat
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from datetime import time as dt_time
+from enum import Enum
 from typing import Any
+from uuid import UUID
+
+from graphiti_memory.journal import EpisodeJournal
+from graphiti_memory.shim import default_socket_path
 
 # Configure logging to stderr
 logging.basicConfig(
@@ -43,12 +60,222 @@ graphiti_client = None
 graphiti_connected = False
 initialization_error = None
 
-# Episode processing queues (for sequential processing per group_id)
+# graphiti_core names used by the tool handlers, imported once with the client
+EpisodeType = None
+EpisodicNode = None
+EntityEdge = None
+NODE_HYBRID_SEARCH_RRF = None
+clear_data = None
+RawEpisode = None
+
+# Group used when a tool call does not name one
+DEFAULT_GROUP_ID = os.environ.get('GRAPHITI_GROUP_ID', 'default')
+
+# Initialization runs in the background; tool calls wait up to READY_TIMEOUT for it
+READY_TIMEOUT = float(os.environ.get('GRAPHITI_READY_TIMEOUT', '30'))
+graphiti_ready = None
+
+# Failed initialization is retried with exponential backoff and jitter
+RECONNECT_BASE_DELAY = float(os.environ.get('GRAPHITI_RECONNECT_BASE_DELAY', '1'))
+RECONNECT_MAX_DELAY = float(os.environ.get('GRAPHITI_RECONNECT_MAX_DELAY', '60'))
+reconnect_attempts = 0
+next_retry_at = None
+
+# Schema fingerprint recorded in the graph; startup skips the index/constraint
+# DDL when it matches. Bump SCHEMA_VERSION whenever this server adds indices.
+SCHEMA_VERSION = "2"
+SCHEMA_NODE_KEY = "graphiti-memory"
+REBUILD_INDICES = os.environ.get('GRAPHITI_REBUILD_INDICES', 'false').lower() == 'true'
+
+# Optional warmup after connecting: fill the Neo4j pool and open the OpenAI
+# connection so the first real call does not pay for the handshakes
+WARMUP = os.environ.get('GRAPHITI_WARMUP', 'false').lower() == 'true'
+WARMUP_CONNECTIONS = int(os.environ.get('GRAPHITI_WARMUP_CONNECTIONS', '4'))
+
+# Episode processing queues (for sequential processing per group_id). The
+# episodes accepted but not yet processed are counted per group in
+# queued_episodes and limited by GRAPHITI_MAX_QUEUED_EPISODES_PER_GROUP and
+# GRAPHITI_MAX_QUEUED_EPISODES; at most GRAPHITI_MAX_CONCURRENT_EPISODES
+# episodes are extracted at once across groups.
+# A worker idle for QUEUE_IDLE_TIMEOUT seconds exits and its group's state is
+# dropped until the group's next episode (0 keeps workers forever).
 episode_queues = {}
 queue_workers = {}
-
-
-async def initialize_graphiti():
+queued_episodes = {}
+QUEUE_IDLE_TIMEOUT = float(os.environ.get('GRAPHITI_QUEUE_IDLE_TIMEOUT', '300'))
+MAX_CONCURRENT_EPISODES = int(os.environ.get('GRAPHITI_MAX_CONCURRENT_EPISODES', '4'))
+episode_semaphore = None
+
+# add_memories splits its episodes into chunks of this size; each chunk is
+# one queue entry, extracted with a single add_episode_bulk call
+EPISODE_BULK_SIZE = int(os.environ.get('GRAPHITI_EPISODE_BULK_SIZE', '20'))
+EPISODE_TOOLS = ("add_memory", "add_memories")
+
+# Micro-batching: a worker may gather up to EPISODE_BATCH_SIZE queued episodes,
+# waiting at most EPISODE_BATCH_WAIT_MS for more, and extract them in one bulk
+# call. A batch size of 1 (the default) processes episodes one at a time;
+# batched episodes go through add_episode_bulk, which skips edge invalidation
+# and date extraction, so batching is opt-in.
+EPISODE_BATCH_SIZE = int(os.environ.get('GRAPHITI_EPISODE_BATCH_SIZE', '1'))
+EPISODE_BATCH_WAIT_MS = float(os.environ.get('GRAPHITI_EPISODE_BATCH_WAIT_MS', '50'))
+
+# Content-hash deduplication: an episode whose normalized content matches one
+# already queued or ingested for its group is not extracted again. Hashes of
+# ingested episodes are stored on their Episodic nodes; the most recent ones
+# are also kept in memory as hash -> (uuid, ingested_at). Only episodes
+# ingested within the last DEDUP_WINDOW seconds count (0 means forever).
+DEDUP = os.environ.get('GRAPHITI_DEDUP', 'true').lower() == 'true'
+DEDUP_CACHE_SIZE = int(os.environ.get('GRAPHITI_DEDUP_CACHE_SIZE', '10000'))
+DEDUP_WINDOW = float(os.environ.get('GRAPHITI_DEDUP_WINDOW', '86400'))
+queued_hashes = {}
+ingested_hashes = OrderedDict()
+
+# Ingestion status of accepted episodes by ticket id, for get_ingestion_status.
+# Bounded; the oldest tickets are evicted first.
+STATUS_TABLE_SIZE = int(os.environ.get('GRAPHITI_STATUS_TABLE_SIZE', '10000'))
+ingestion_status = OrderedDict()
+
+# Optional write-ahead journal (SQLite file) so queued episodes survive a restart
+EPISODE_JOURNAL = os.environ.get('GRAPHITI_EPISODE_JOURNAL', '')
+episode_journal = None
+journal_backlog = []
+
+# MCP protocol versions, newest first. From 2025-06-18 on, tool results are
+# returned once as structuredContent instead of JSON text inside a text block;
+# clients that only read text negotiate an older version and still get it.
+# GRAPHITI_STRUCTURED_TEXT_FALLBACK opts in to sending both.
+SUPPORTED_PROTOCOL_VERSIONS = ("2025-06-18", "2025-03-26", "2024-11-05")
+LEGACY_PROTOCOL_VERSION = "2024-11-05"
+STRUCTURED_CONTENT_PROTOCOL_VERSION = "2025-06-18"
+STRUCTURED_TEXT_FALLBACK = os.environ.get('GRAPHITI_STRUCTURED_TEXT_FALLBACK', 'false').lower() == 'true'
+
+# JSON codec: orjson or msgspec when installed, stdlib json otherwise
+JSON_CODEC = os.environ.get('GRAPHITI_JSON_CODEC', 'auto')
+
+# Upper bound for a single JSON-RPC line read from stdin
+MAX_MESSAGE_BYTES = int(os.environ.get('GRAPHITI_MAX_MESSAGE_BYTES', str(16 * 1024 * 1024)))
+
+# Concurrent tools/call dispatch (responses may complete out of order)
+MAX_CONCURRENT_CALLS = int(os.environ.get('GRAPHITI_MAX_CONCURRENT_CALLS', '8'))
+tool_call_semaphore = None
+
+# Admission control: shed load with a fast "server busy" error instead of
+# letting requests time out behind an ever-growing backlog
+MAX_INFLIGHT_SEARCHES = int(os.environ.get('GRAPHITI_MAX_INFLIGHT_SEARCHES', '32'))
+MAX_QUEUED_EPISODES_PER_GROUP = int(os.environ.get('GRAPHITI_MAX_QUEUED_EPISODES_PER_GROUP', '100'))
+MAX_QUEUED_EPISODES = int(os.environ.get('GRAPHITI_MAX_QUEUED_EPISODES', '1000'))
+SEARCH_TOOLS = ("search_memory_nodes", "search_memory_facts")
+ERROR_SERVER_BUSY = -32003
+inflight_searches = 0
+
+# Per-tool deadlines in seconds. GRAPHITI_TOOL_TIMEOUTS overrides single tools,
+# e.g. "search_memory_facts=10,clear_graph=300"; callers may ask for less with
+# a timeout_ms argument. Episode extraction in the queue worker has its own.
+TOOL_TIMEOUT = float(os.environ.get('GRAPHITI_TOOL_TIMEOUT', '60'))
+TOOL_TIMEOUTS = {
+    name.strip(): float(seconds)
+    for name, _, seconds in (
+        item.partition('=') for item in os.environ.get('GRAPHITI_TOOL_TIMEOUTS', '').split(',') if '=' in item
+    )
+}
+EPISODE_TIMEOUT = float(os.environ.get('GRAPHITI_EPISODE_TIMEOUT', '600'))
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', '60'))
+ERROR_REQUEST_TIMEOUT = -32001
+
+# Moving averages of service times (seconds), used for retry-after hints
+search_seconds_avg = 1.0
+episode_seconds_avg = 5.0
+
+# Outgoing messages are funnelled through a single writer task
+OUTPUT_QUEUE_SIZE = int(os.environ.get('GRAPHITI_OUTPUT_QUEUE_SIZE', '256'))
+
+# Streamable HTTP transport (one process, many client sessions)
+TRANSPORT = os.environ.get('GRAPHITI_TRANSPORT', 'stdio')
+HTTP_HOST = os.environ.get('GRAPHITI_HTTP_HOST', '127.0.0.1')
+HTTP_PORT = int(os.environ.get('GRAPHITI_HTTP_PORT', '8765'))
+HTTP_PATH = os.environ.get('GRAPHITI_HTTP_PATH', '/mcp')
+HTTP_ALLOWED_ORIGINS = [o.strip() for o in os.environ.get('GRAPHITI_HTTP_ALLOWED_ORIGINS', '').split(',') if o.strip()]
+HTTP_SESSION_TTL = float(os.environ.get('GRAPHITI_HTTP_SESSION_TTL', '3600'))
+http_sessions = {}
+
+# Shared daemon on a Unix domain socket, fronted by graphiti-mcp-shim
+DAEMON_SOCKET = default_socket_path()
+
+
+def schema_fingerprint():
+    """Fingerprint of the schema this server and graphiti-core expect."""
+    try:
+        from importlib.metadata import version
+        core_version = version("graphiti-core")
+    except Exception:
+        core_version = "unknown"
+    return hashlib.sha256(f"{SCHEMA_VERSION}:{core_version}".encode()).hexdigest()[:16]
+
+
+async def read_schema_fingerprint():
+    """Return the fingerprint stored in the graph, or None."""
+    records, _, _ = await graphiti_client.driver.execute_query(
+        "MATCH (s:GraphitiMemorySchema {key: $key}) RETURN s.fingerprint AS fingerprint",
+        key=SCHEMA_NODE_KEY,
+    )
+    return records[0]["fingerprint"] if records else None
+
+
+async def write_schema_fingerprint(fingerprint):
+    """Record the fingerprint of the schema now present in the graph."""
+    await graphiti_client.driver.execute_query(
+        "MERGE (s:GraphitiMemorySchema {key: $key}) "
+        "SET s.fingerprint = $fingerprint, s.updated_at = datetime()",
+        key=SCHEMA_NODE_KEY,
+        fingerprint=fingerprint,
+    )
+
+
+async def ensure_graph_schema(force=False):
+    """Build indices and constraints unless the graph's fingerprint is current.
+
+    Returns True if the DDL was run.
+    """
+    fingerprint = schema_fingerprint()
+    if not force:
+        try:
+            stored = await read_schema_fingerprint()
+        except Exception as e:
+            logger.warning(f"Could not read schema fingerprint: {e}")
+            stored = None
+        if stored == fingerprint:
+            logger.info(f"Schema fingerprint {fingerprint} matches; skipping index build")
+            return False
+
+    logger.info("Building indices and constraints")
+    await graphiti_client.build_indices_and_constraints()
+    # Duplicate lookups by content hash (see find_duplicates)
+    await graphiti_client.driver.execute_query(
+        "CREATE INDEX episodic_content_hash IF NOT EXISTS FOR (e:Episodic) ON (e.group_id, e.content_hash)"
+    )
+    await write_schema_fingerprint(fingerprint)
+    return True
+
+
+def load_tool_dependencies():
+    """Import graphiti_core, set the names the tool handlers use and return the client classes.
+
+    Returns (Graphiti, OpenAIClient, LLMConfig, OpenAIEmbedder, OpenAIEmbedderConfig).
+    """
+    global EpisodeType, EpisodicNode, EntityEdge, NODE_HYBRID_SEARCH_RRF, clear_data, RawEpisode
+    from graphiti_core import Graphiti
+    from graphiti_core.llm_client import OpenAIClient
+    from graphiti_core.llm_client.config import LLMConfig
+    from graphiti_core.embedder.openai import OpenAIEmbedder, OpenAIEmbedderConfig
+    from graphiti_core.nodes import EpisodeType, EpisodicNode
+    from graphiti_core.edges import EntityEdge
+    from graphiti_core.search.search_config_recipes import NODE_HYBRID_SEARCH_RRF
+    from graphiti_core.utils.maintenance.graph_data_operations import clear_data
+    from graphiti_core.utils.bulk_utils import RawEpisode
+    return Graphiti, OpenAIClient, LLMConfig, OpenAIEmbedder, OpenAIEmbedderConfig
+
+
+async def initialize_graphiti(rebuild_indices=False):
     """Initialize the Graphiti client with Neo4j and optional LLM."""
     global graphiti_client, graphiti_connected, initialization_error
 
@@ -65,11 +292,11 @@ async def initialize_graphiti():
     logger.info(f"OpenAI API Key: {'configured' if openai_key else 'not configured'}")
 
     try:
-        # Import Graphiti dependencies
-        from graphiti_core import Graphiti
-        from graphiti_core.llm_client import OpenAIClient
-        from graphiti_core.llm_client.config import LLMConfig
-        from graphiti_core.embedder.openai import OpenAIEmbedder, OpenAIEmbedderConfig
+        # Importing graphiti_core takes seconds; do it on a worker thread so the
+        # event loop keeps answering initialize and tools/list meanwhile
+        Graphiti, OpenAIClient, LLMConfig, OpenAIEmbedder, OpenAIEmbedderConfig = await asyncio.to_thread(
+            load_tool_dependencies
+        )
 
         # Create LLM client if API key is available
         llm_client = None
@@ -88,6 +315,12 @@ async def initialize_graphiti():
                 embedding_model=os.environ.get('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small')
             )
             embedder_client = OpenAIEmbedder(config=embedder_config)
+
+            # Bound every OpenAI HTTP request so a stalled call cannot outlive tool deadlines
+            for wrapper in (llm_client, embedder_client):
+                openai_client = getattr(wrapper, 'client', None)
+                if hasattr(openai_client, 'with_options'):
+                    wrapper.client = openai_client.with_options(timeout=OPENAI_TIMEOUT)
             logger.info(f"✅ LLM client initialized with model: {llm_config.model}")
         else:
             logger.warning("⚠️ OpenAI API key not found - entity extraction will be limited")
@@ -101,10 +334,11 @@ async def initialize_graphiti():
             embedder=embedder_client,
         )
 
-        # Build indices and constraints
-        await graphiti_client.build_indices_and_constraints()
+        # Build indices and constraints (skipped when already current)
+        await ensure_graph_schema(force=rebuild_indices)
 
         graphiti_connected = True
+        initialization_error = None
         logger.info("=" * 60)
         logger.info("✅ Graphiti client initialized successfully!")
         logger.info("=" * 60)
@@ -137,514 +371,2455 @@ async def initialize_graphiti():
         return False
 
 
+def _json_default(obj):
+    """Encode values the JSON libraries do not handle on their own."""
+    if isinstance(obj, (datetime, date, dt_time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def load_json_codec(preference="auto"):
+    """Return (name, dumps, loads) for the preferred available JSON library.
+
+    dumps() always returns UTF-8 bytes and loads() accepts bytes or str and
+    raises ValueError on malformed input, whichever library is in use.
+    """
+    candidates = ["orjson", "msgspec", "json"] if preference == "auto" else [preference]
+
+    for name in candidates:
+        if name == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                continue
+
+            def dumps(obj):
+                try:
+                    return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+                except orjson.JSONEncodeError:
+                    # e.g. integers wider than 64 bits; let the stdlib have a go
+                    return _stdlib_dumps(obj)
+
+            return name, dumps, orjson.loads
+
+        if name == "msgspec":
+            try:
+                import msgspec
+            except ImportError:
+                continue
+            encoder = msgspec.json.Encoder(enc_hook=_json_default)
+            decoder = msgspec.json.Decoder()
+
+            def loads(data):
+                try:
+                    return decoder.decode(data)
+                except msgspec.DecodeError as e:
+                    raise ValueError(str(e)) from e
+
+            return name, encoder.encode, loads
+
+        if name == "json":
+            return name, _stdlib_dumps, json.loads
+
+        raise ValueError(f"Unknown JSON codec: {name}")
+
+    logger.warning(f"JSON codec '{preference}' is not installed, using stdlib json")
+    return "json", _stdlib_dumps, json.loads
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(
+        obj, default=_json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+json_codec_name, json_dumps, json_loads = load_json_codec(JSON_CODEC)
+
+
+def json_dumps_text(obj):
+    """Encode obj as a JSON string (for text content blocks)."""
+    return json_dumps(obj).decode("utf-8")
+
+
+class RawJSON(bytes):
+    """An already-encoded JSON message, written out as-is."""
+
+
+def encode_message(message):
+    """Encode an outgoing message or batch, passing RawJSON through untouched."""
+    if isinstance(message, RawJSON):
+        return message
+    if isinstance(message, list):
+        return b"[" + b",".join(encode_message(item) for item in message) + b"]"
+    return json_dumps(message)
+
+
+def raw_response(request_id, result):
+    """Build a JSON-RPC response around an already-encoded result."""
+    return RawJSON(b'{"jsonrpc":"2.0","id":' + json_dumps(request_id) + b',"result":' + result + b'}')
+
+
+def extend_json_object(encoded, fields):
+    """Add fields to an already-encoded, non-empty JSON object."""
+    return encoded[:-1] + b"," + json_dumps(fields)[1:]
+
+
+async def supervise_graphiti(rebuild_indices=False):
+    """Initialize Graphiti in the background, retrying until it connects.
+
+    The protocol loop is already serving requests while this runs. Failed
+    attempts are retried after an exponentially growing, jittered delay, so a
+    Neo4j restart or network blip no longer leaves the server disconnected
+    until the process is restarted.
+    """
+    global reconnect_attempts, next_retry_at
+
+    while True:
+        try:
+            connected = await initialize_graphiti(rebuild_indices)
+        finally:
+            # Callers waiting on the first attempt may proceed either way
+            graphiti_ready.set()
+
+        if connected:
+            reconnect_attempts = 0
+            next_retry_at = None
+            if journal_backlog:
+                asyncio.create_task(replay_journal())
+            if WARMUP:
+                await warm_up_graphiti()
+            return
+
+        await close_graphiti_client()
+        reconnect_attempts += 1
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (reconnect_attempts - 1))
+        delay = random.uniform(delay / 2, delay)
+        next_retry_at = time.monotonic() + delay
+        logger.info(f"Retrying Graphiti initialization in {delay:.1f}s (retry {reconnect_attempts})")
+        await asyncio.sleep(delay)
+        next_retry_at = None
+
+
+async def warm_up_graphiti():
+    """Open Neo4j pool connections and the OpenAI HTTP connections.
+
+    Runs concurrent trivial reads so the driver opens (and keeps) that many
+    pooled connections, then makes one cheap OpenAI request per client. Without
+    an API key there is no OpenAI client and that step is skipped. Failures are
+    logged; warmup never affects the connection status.
+    """
+    started = time.monotonic()
+
+    async def ping():
+        await graphiti_client.driver.execute_query("RETURN 1 AS ok")
+
+    results = await asyncio.gather(*(ping() for _ in range(WARMUP_CONNECTIONS)), return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning(f"Neo4j warmup: {len(failures)} of {len(results)} queries failed: {failures[0]}")
+
+    openai_clients = [
+        getattr(wrapper, 'client', None)
+        for wrapper in (graphiti_client.llm_client, graphiti_client.embedder)
+        if wrapper is not None
+    ]
+    openai_clients = [client for client in openai_clients if hasattr(client, 'models')]
+    if not openai_clients:
+        logger.info("OpenAI warmup skipped: no API key configured")
+    for client in openai_clients:
+        try:
+            await client.models.list()
+        except Exception as e:
+            logger.warning(f"OpenAI warmup failed: {e}")
+
+    logger.info(f"Warmup finished in {time.monotonic() - started:.2f}s ({WARMUP_CONNECTIONS} Neo4j connections)")
+
+
+async def close_graphiti_client():
+    """Close a half-initialized Graphiti client before retrying."""
+    global graphiti_client
+    if graphiti_client is None:
+        return
+    try:
+        await graphiti_client.close()
+    except Exception as e:
+        logger.debug(f"Error closing Graphiti client: {e}")
+    graphiti_client = None
+
+
+def graphiti_status():
+    """Return 'connected', 'initializing', 'reconnecting' or 'disconnected'."""
+    if graphiti_connected:
+        return "connected"
+    if graphiti_ready is not None and not graphiti_ready.is_set():
+        return "initializing"
+    if reconnect_attempts and next_retry_at is None:
+        return "reconnecting"
+    return "disconnected"
+
+
+def graphiti_retry_in():
+    """Seconds until the next initialization attempt, or None if none is scheduled."""
+    if next_retry_at is None:
+        return None
+    return round(max(0.0, next_retry_at - time.monotonic()), 1)
+
+
+async def wait_for_graphiti():
+    """Wait up to READY_TIMEOUT seconds for background initialization to finish."""
+    if graphiti_ready is None or graphiti_ready.is_set():
+        return
+    try:
+        await asyncio.wait_for(graphiti_ready.wait(), timeout=READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Graphiti still initializing after {READY_TIMEOUT}s")
+
+
+class QueuedEpisode:
+    """An accepted add_memory episode waiting in its group's queue."""
+
+    def __init__(self, name, episode_body, group_id, source="text", source_description="",
+                 reference_time=None, journal_id=None):
+        self.name = name
+        self.episode_body = episode_body
+        self.group_id = group_id
+        self.source = source
+        self.source_description = source_description
+        self.reference_time = reference_time or datetime.now(timezone.utc)
+        self.journal_id = journal_id
+        self.content_hash = content_hash(group_id, source, episode_body)
+        self.status = None
+
+    def to_record(self):
+        """Return the fields needed to process this episode again after a restart."""
+        return {
+            "name": self.name,
+            "episode_body": self.episode_body,
+            "group_id": self.group_id,
+            "source": self.source,
+            "source_description": self.source_description,
+            "reference_time": self.reference_time.isoformat(),
+        }
+
+    @classmethod
+    def from_record(cls, record, journal_id=None):
+        return cls(
+            record["name"],
+            record["episode_body"],
+            record["group_id"],
+            record["source"],
+            record["source_description"],
+            datetime.fromisoformat(record["reference_time"]),
+            journal_id=journal_id,
+        )
+
+
+class IngestionStatus:
+    """Lifecycle of one accepted episode: queued, running, then done or failed."""
+
+    def __init__(self, episode):
+        self.ticket = uuid.uuid4().hex
+        self.name = episode.name
+        self.group_id = episode.group_id
+        self.state = "queued"
+        self.error = None
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        """Report the state with enqueue-to-start wait and processing time so far."""
+        now = time.monotonic()
+        waited = (self.started_at or now) - self.queued_at
+        processing = None if self.started_at is None else (self.finished_at or now) - self.started_at
+        return {
+            "ticket": self.ticket,
+            "name": self.name,
+            "group_id": self.group_id,
+            "state": self.state,
+            "error": self.error,
+            "wait_ms": int(waited * 1000),
+            "processing_ms": None if processing is None else int(processing * 1000)
+        }
+
+
+def track_ingestion(episode):
+    """Issue a ticket for a queued episode and return it."""
+    status = episode.status = IngestionStatus(episode)
+    ingestion_status[status.ticket] = status
+    while len(ingestion_status) > STATUS_TABLE_SIZE:
+        ingestion_status.popitem(last=False)
+    return status.ticket
+
+
+def mark_running(episode):
+    status = episode.status
+    # A bulk batch retried one episode at a time keeps its original start
+    if status is not None and status.started_at is None:
+        status.state = "running"
+        status.started_at = time.monotonic()
+
+
+def content_hash(group_id, source, episode_body):
+    """Hash an episode's content for deduplication, ignoring whitespace differences."""
+    normalized = " ".join(episode_body.split())
+    return hashlib.sha256(f"{group_id}\0{source}\0{normalized}".encode()).hexdigest()
+
+
+def remember_ingested(digest, episode_uuid, ingested_at=None):
+    """Add an ingested episode's content hash to the in-memory LRU."""
+    ingested_hashes[digest] = (episode_uuid, time.time() if ingested_at is None else ingested_at)
+    ingested_hashes.move_to_end(digest)
+    while len(ingested_hashes) > DEDUP_CACHE_SIZE:
+        ingested_hashes.popitem(last=False)
+
+
+def track_queued(episode):
+    """Register a queued episode's hash so later copies are recognized."""
+    if DEDUP:
+        queued_hashes.setdefault(episode.group_id, {})[episode.content_hash] = episode
+
+
+def untrack_queued(episode):
+    hashes = queued_hashes.get(episode.group_id)
+    if hashes and hashes.get(episode.content_hash) is episode:
+        del hashes[episode.content_hash]
+
+
+async def find_duplicates(group_id, episodes):
+    """Split episodes into new ones and copies of queued or ingested episodes.
+
+    Hashes missing from the in-memory LRU are looked up in the graph with one
+    query. Returns (new_episodes, duplicates), where each duplicate is
+    (episode, state, existing_uuid, original) and state is "queued" or
+    "ingested"; original is the queued copy (possibly earlier in the same
+    call, not yet ticketed), if any.
+    """
+    if not DEDUP:
+        return episodes, []
+
+    since = None
+    if DEDUP_WINDOW > 0:
+        cutoff = time.time() - DEDUP_WINDOW
+        since = datetime.fromtimestamp(cutoff, timezone.utc)
+        # Cached copies older than the window no longer count
+        for episode in episodes:
+            known = ingested_hashes.get(episode.content_hash)
+            if known is not None and known[1] < cutoff:
+                del ingested_hashes[episode.content_hash]
+
+    unknown = [episode.content_hash for episode in episodes if episode.content_hash not in ingested_hashes]
+    if unknown:
+        try:
+            records, _, _ = await graphiti_client.driver.execute_query(
+                "UNWIND $hashes AS hash "
+                "MATCH (e:Episodic {group_id: $group_id, content_hash: hash}) "
+                "WHERE $since IS NULL OR e.created_at > $since "
+                "RETURN hash, e.uuid AS uuid, e.created_at.epochSeconds AS created_at",
+                hashes=unknown,
+                group_id=group_id,
+                since=since,
+            )
+            for record in records:
+                remember_ingested(record["hash"], record["uuid"], record["created_at"])
+        except Exception as e:
+            logger.warning(f"Content hash lookup failed: {e}")
+
+    # Checked after the lookup, so copies queued meanwhile are seen too
+    queued = queued_hashes.get(group_id, {})
+    new_episodes, duplicates, seen = [], [], {}
+    for episode in episodes:
+        digest = episode.content_hash
+        original = queued.get(digest) or seen.get(digest)
+        if original is not None:
+            duplicates.append((episode, "queued", None, original))
+        elif digest in ingested_hashes:
+            ingested_hashes.move_to_end(digest)
+            duplicates.append((episode, "ingested", ingested_hashes[digest][0], None))
+        else:
+            seen[digest] = episode
+            new_episodes.append(episode)
+    return new_episodes, duplicates
+
+
+async def record_content_hashes(episodes):
+    """Store the content hashes of newly ingested episodes on their Episodic nodes."""
+    if not DEDUP:
+        return
+    for episode in episodes:
+        remember_ingested(episode.content_hash, None)
+    try:
+        records, _, _ = await graphiti_client.driver.execute_query(
+            "UNWIND $rows AS row "
+            "MATCH (e:Episodic {group_id: row.group_id, name: row.name}) "
+            "WHERE e.content = row.content AND e.content_hash IS NULL "
+            "SET e.content_hash = row.content_hash "
+            "RETURN row.content_hash AS content_hash, e.uuid AS uuid",
+            rows=[
+                {
+                    "group_id": episode.group_id,
+                    "name": episode.name,
+                    "content": episode.episode_body,
+                    "content_hash": episode.content_hash,
+                }
+                for episode in episodes
+            ],
+        )
+    except Exception as e:
+        logger.warning(f"Could not store content hashes: {e}")
+        return
+    for record in records:
+        remember_ingested(record["content_hash"], record["uuid"])
+
+
+def episode_queue(group_id):
+    """Return the group's episode queue, creating it and starting its worker if needed."""
+    queue = episode_queues.get(group_id)
+    if queue is None:
+        # Unbounded: the limits count episodes, not entries (see reserve_episodes)
+        queue = episode_queues[group_id] = asyncio.Queue()
+    if not queue_workers.get(group_id, False):
+        # Marked here rather than in the worker so a second call cannot start another
+        queue_workers[group_id] = True
+        asyncio.create_task(process_episode_queue(group_id))
+    return queue
+
+
+async def process_episode(episode):
+    """Extract one queued episode into the graph and journal the outcome."""
+    name = episode.name
+    error = None
+    mark_running(episode)
+    try:
+        logger.info(f"Processing episode '{name}' for group_id: {episode.group_id}")
+        await asyncio.wait_for(
+            graphiti_client.add_episode(
+                name=name,
+                episode_body=episode.episode_body,
+                source=EpisodeType[episode.source],
+                source_description=episode.source_description,
+                group_id=episode.group_id,
+                reference_time=episode.reference_time,
+            ),
+            timeout=EPISODE_TIMEOUT,
+        )
+        logger.info(f"Episode '{name}' processed successfully")
+        await record_content_hashes([episode])
+    except asyncio.TimeoutError:
+        error = f"timed out after {EPISODE_TIMEOUT}s"
+        logger.error(f"Episode '{name}' {error}")
+    except Exception as e:
+        error = str(e)
+        logger.error(f"Error processing episode '{name}': {e}")
+
+    await finish_episode(episode, error)
+
+
+async def process_episode_bulk(episodes):
+    """Extract a chunk of one group's episodes with a single add_episode_bulk call.
+
+    Graphiti embeds the chunk's nodes and edges in batches and writes them to
+    Neo4j together, instead of running one extraction pipeline per episode.
+    """
+    group_id = episodes[0].group_id
+    error = None
+    try:
+        logger.info(f"Processing {len(episodes)} episodes in bulk for group_id: {group_id}")
+        for episode in episodes:
+            mark_running(episode)
+        await asyncio.wait_for(
+            graphiti_client.add_episode_bulk(
+                [
+                    RawEpisode(
+                        name=episode.name,
+                        content=episode.episode_body,
+                        source=EpisodeType[episode.source],
+                        source_description=episode.source_description,
+                        reference_time=episode.reference_time,
+                    )
+                    for episode in episodes
+                ],
+                group_id=group_id,
+            ),
+            timeout=EPISODE_TIMEOUT,
+        )
+        logger.info(f"{len(episodes)} episodes processed successfully")
+        await record_content_hashes(episodes)
+    except asyncio.TimeoutError:
+        # Retrying one by one would multiply the stall, so the batch fails
+        error = f"bulk extraction timed out after {EPISODE_TIMEOUT}s"
+        logger.error(f"{len(episodes)} episodes for group_id {group_id}: {error}")
+    except Exception as e:
+        # One bad episode should not fail the rest: retry each on its own
+        logger.warning(
+            f"Bulk extraction of {len(episodes)} episodes for group_id {group_id} failed ({e}); "
+            "retrying them one at a time"
+        )
+        for episode in episodes:
+            await process_episode(episode)
+        return
+
+    for episode in episodes:
+        await finish_episode(episode, error)
+
+
+async def finish_episode(episode, error=None):
+    """Mark a processed episode done, or failed with error, in its status and the journal."""
+    untrack_queued(episode)
+    if episode.status is not None:
+        episode.status.state = "done" if error is None else "failed"
+        episode.status.error = error
+        episode.status.finished_at = time.monotonic()
+    if episode_journal is None or episode.journal_id is None:
+        return
+    try:
+        if error is None:
+            await episode_journal.mark_done(episode.journal_id)
+        else:
+            await episode_journal.mark_failed(episode.journal_id, error)
+    except Exception as e:
+        logger.error(f"Could not update journal entry {episode.journal_id}: {e}")
+
+
+async def replay_journal():
+    """Queue the episodes left pending in the journal by a previous run."""
+    global journal_backlog
+    backlog, journal_backlog = journal_backlog, []
+    logger.info(f"Replaying {len(backlog)} pending episodes from the journal")
+    for journal_id, record in backlog:
+        try:
+            episode = QueuedEpisode.from_record(record, journal_id)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Skipping unreadable journal entry {journal_id}: {e}")
+            await episode_journal.mark_failed(journal_id, f"unreadable: {e}")
+            continue
+        # Counted against the limits but never shed; these were already accepted
+        track_queued(episode)
+        track_ingestion(episode)
+        adjust_queued_episodes(episode.group_id, 1)
+        episode_queue(episode.group_id).put_nowait(episode)
+
+
+def _entry_episodes(entry):
+    return list(entry) if isinstance(entry, list) else [entry]
+
+
+async def get_with_timeout(queue, timeout):
+    """Return the next queue entry, or None if none arrives within timeout seconds."""
+    # Not wait_for(): on timeout it can drop an item get() already took
+    getter = asyncio.ensure_future(queue.get())
+    try:
+        await asyncio.wait({getter}, timeout=timeout)
+    finally:
+        if not getter.done():
+            getter.cancel()
+            await asyncio.wait({getter})
+    if getter.cancelled():
+        return None
+    return getter.result()
+
+
+def evict_group(group_id):
+    """Drop an idle group's queue, worker flag and dedup state.
+
+    Synchronous, so no add_memory can slip an episode into the queue between
+    the emptiness check and the eviction; episode_queue() recreates the state.
+    Only call it once the group has no queued_episodes, so no reserved episode
+    loses its entry in queued_hashes.
+    """
+    episode_queues.pop(group_id, None)
+    queue_workers.pop(group_id, None)
+    queued_hashes.pop(group_id, None)
+
+
+async def collect_episode_batch(queue, entries, episodes):
+    """Extend a micro-batch with more queued entries for the same group.
+
+    Takes whatever is already queued, then waits up to EPISODE_BATCH_WAIT_MS
+    for more, until EPISODE_BATCH_SIZE episodes are collected. entries and
+    episodes are extended in place.
+    """
+    deadline = time.monotonic() + EPISODE_BATCH_WAIT_MS / 1000
+    while len(episodes) < EPISODE_BATCH_SIZE:
+        if not queue.empty():
+            entry = queue.get_nowait()
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            entry = await get_with_timeout(queue, remaining)
+            if entry is None:
+                break
+        entries.append(entry)
+        episodes.extend(_entry_episodes(entry))
+
+
 async def process_episode_queue(group_id: str):
     """Process episodes for a specific group_id sequentially."""
     global queue_workers
 
     logger.info(f"Starting episode queue worker for group_id: {group_id}")
     queue_workers[group_id] = True
+    evicted = False
 
     try:
         while True:
-            process_func = await episode_queues[group_id].get()
+            # An entry is one episode, or a chunk of them from add_memories
+            queue = episode_queues[group_id]
+            if QUEUE_IDLE_TIMEOUT > 0:
+                entry = await get_with_timeout(queue, QUEUE_IDLE_TIMEOUT)
+                if entry is None:
+                    # An add_memory that reserved a slot and tracked its hash may
+                    # still be awaiting the journal before it queues the episode
+                    if not queue.empty() or queued_episodes.get(group_id, 0):
+                        continue
+                    logger.info(f"Episode queue for group_id {group_id} idle for {QUEUE_IDLE_TIMEOUT}s")
+                    evict_group(group_id)
+                    evicted = True
+                    return
+            else:
+                entry = await queue.get()
+            entries = [entry]
+            episodes = _entry_episodes(entry)
             try:
-                await process_func()
+                if EPISODE_BATCH_SIZE > 1:
+                    await collect_episode_batch(queue, entries, episodes)
+                async with episode_semaphore:
+                    started = time.monotonic()
+                    try:
+                        if len(episodes) > 1 or isinstance(entries[0], list):
+                            await process_episode_bulk(episodes)
+                        else:
+                            await process_episode(episodes[0])
+                    finally:
+                        record_service_time("episode", (time.monotonic() - started) / len(episodes))
             except Exception as e:
                 logger.error(f"Error processing queued episode for group_id {group_id}: {e}")
             finally:
-                episode_queues[group_id].task_done()
+                adjust_queued_episodes(group_id, -len(episodes))
+                for _ in entries:
+                    queue.task_done()
+            # Semaphore waiters are served in FIFO order; yielding here lets
+            # groups already waiting take the freed slot before this worker
+            # asks again, so busy groups take turns instead of starving others
+            await asyncio.sleep(0)
     except asyncio.CancelledError:
         logger.info(f"Episode queue worker for group_id {group_id} was cancelled")
     except Exception as e:
         logger.error(f"Unexpected error in queue worker for group_id {group_id}: {e}")
     finally:
-        queue_workers[group_id] = False
+        if not evicted:
+            queue_workers[group_id] = False
         logger.info(f"Stopped episode queue worker for group_id: {group_id}")
 
 
-def send_response(response):
-    """Send JSON-RPC response to stdout."""
-    json_str = json.dumps(response)
-    sys.stdout.write(json_str + "\n")
+async def read_stream_lines(reader):
+    """Yield lines from an asyncio StreamReader until EOF."""
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError as e:
+            # Line exceeded MAX_MESSAGE_BYTES; the reader drops what it buffered
+            logger.error(f"Discarding oversized message: {e}")
+            continue
+        if not line:
+            return
+        yield line
+
+
+async def read_stdin_lines():
+    """Yield raw lines from stdin without blocking the event loop.
+
+    Pipes and sockets are attached to an asyncio StreamReader. Anything else
+    (a terminal, a redirected file) is read by a daemon thread that hands lines
+    to the event loop through a bounded queue.
+    """
+    loop = asyncio.get_running_loop()
+    mode = os.fstat(sys.stdin.fileno()).st_mode
+
+    if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode):
+        reader = asyncio.StreamReader(limit=MAX_MESSAGE_BYTES)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+        )
+        async for line in read_stream_lines(reader):
+            yield line
+        return
+
+    queue = asyncio.Queue(maxsize=64)
+
+    def pump():
+        try:
+            for line in sys.stdin.buffer:
+                asyncio.run_coroutine_threadsafe(queue.put(line), loop).result()
+        except Exception as e:
+            logger.error(f"stdin reader thread stopped: {e}")
+        finally:
+            try:
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+    threading.Thread(target=pump, name="stdin-reader", daemon=True).start()
+
+    while True:
+        line = await queue.get()
+        if line is None:
+            return
+        yield line
+
+
+class _BlockingStdoutWriter:
+    """StreamWriter-like adapter for stdout targets that cannot be made non-blocking."""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        pass
+
+
+async def open_stdout_writer():
+    """Return a writer for stdout, using a non-blocking pipe transport when safe."""
+    loop = asyncio.get_running_loop()
+    stdout_stat = os.fstat(sys.stdout.fileno())
+    is_pipe = stat.S_ISFIFO(stdout_stat.st_mode) or stat.S_ISSOCK(stdout_stat.st_mode)
+
+    # Switching stdout to O_NONBLOCK would leak into stderr/stdin if they share it
+    shared = any(
+        os.path.samestat(stdout_stat, os.fstat(stream.fileno()))
+        for stream in (sys.stderr, sys.stdin)
+    )
+
+    if not is_pipe or shared:
+        return _BlockingStdoutWriter()
+
     sys.stdout.flush()
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), sys.stdout
+    )
+    return asyncio.StreamWriter(transport, protocol, None, loop)
+
+
+class OutputChannel:
+    """Single writer for newline-delimited JSON-RPC messages.
+
+    Messages from concurrent tasks are queued and written by one task, so lines
+    never interleave. Whatever is pending when the writer wakes up is coalesced
+    into a single write and drain. The queue is bounded: when the client reads
+    slowly, drain() blocks the writer and senders wait in send(), while
+    best-effort messages sent with send_nowait() are dropped instead.
+    """
+
+    def __init__(self, writer, maxsize=OUTPUT_QUEUE_SIZE):
+        self._writer = writer
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._task = asyncio.create_task(self._run())
+        self._closed = False
+
+    async def send(self, message):
+        """Queue a message for writing, waiting if the queue is full."""
+        if self._closed:
+            logger.debug("Dropping message: output channel is closed")
+            return
+        await self._queue.put(message)
+
+    def send_nowait(self, message):
+        """Queue a message for writing, raising asyncio.QueueFull if the queue is full."""
+        if self._closed:
+            logger.debug("Dropping message: output channel is closed")
+            return
+        self._queue.put_nowait(message)
+
+    async def close(self):
+        """Flush queued messages and stop the writer task."""
+        if self._closed:
+            return
+        self._closed = True
+        await self._queue.put(None)
+        await self._task
+
+    async def _run(self):
+        broken = False
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            stop = batch[-1] is None
+            chunks = []
+            for message in batch:
+                if message is None or broken:
+                    continue
+                try:
+                    chunks.append(encode_message(message) + b"\n")
+                except (TypeError, ValueError) as e:
+                    logger.error(f"Failed to encode outgoing message: {e}")
 
+            if chunks:
+                try:
+                    self._writer.write(b"".join(chunks))
+                    await self._writer.drain()
+                except (ConnectionError, BrokenPipeError) as e:
+                    # Keep consuming so senders never block on a dead stream
+                    logger.error(f"Output stream closed: {e}")
+                    broken = True
+
+            if stop:
+                return
+
+
+class Session:
+    """Protocol state for one connected client.
+
+    stdio has a single session for the life of the process; the HTTP transport
+    keeps one per Mcp-Session-Id, all sharing the same Graphiti client and
+    episode queues.
+    """
+
+    def __init__(self, send=None, send_nowait=None):
+        self.id = uuid.uuid4().hex
+        self.protocol_version = LEGACY_PROTOCOL_VERSION
+        self.in_flight = {}
+        self.send_message = send
+        self.send_message_nowait = send_nowait
+        # HTTP only: progressToken -> put_nowait of the POST stream answering
+        # that request. None means progress shares the session's one stream.
+        self.request_streams = None
+        self.last_seen = time.monotonic()
+
+    async def send(self, message):
+        """Send a message to the client, if it currently has a stream to receive it."""
+        if self.send_message is None:
+            logger.debug(f"Session {self.id} has no open stream; dropping message")
+            return
+        await self.send_message(message)
+
+    def notify(self, message, progress_token=None):
+        """Send a message only if it can be queued without waiting; otherwise drop it.
+
+        On HTTP, progress only goes to the POST stream answering its request,
+        and is dropped once that stream has closed: the GET stream is not for
+        messages about running requests.
+        """
+        send = self.send_message_nowait
+        if progress_token is not None and self.request_streams is not None:
+            send = self.request_streams.get(progress_token) if isinstance(progress_token, (str, int)) else None
+        if send is None:
+            logger.debug(f"Session {self.id} has no open stream; dropping message")
+            return
+        try:
+            send(message)
+        except asyncio.QueueFull:
+            logger.debug(f"Session {self.id} output is backed up; dropping message")
 
-def handle_initialize(request_id):
-    """Handle initialize request."""
+    def close(self):
+        """Cancel every tool call still running for this session."""
+        for task in list(self.in_flight.values()):
+            task.cancel()
+
+
+def negotiate_protocol_version(requested):
+    """Pick the protocol version to answer an initialize request with."""
+    if not requested:
+        # Clients that do not ask for a version get the original protocol
+        return LEGACY_PROTOCOL_VERSION
+    if requested in SUPPORTED_PROTOCOL_VERSIONS:
+        return requested
+    return SUPPORTED_PROTOCOL_VERSIONS[0]
+
+
+def build_tool_result(session, result):
+    """Wrap a tool's result dict in an MCP CallToolResult.
+
+    Clients on a protocol version with structuredContent get the dict as-is,
+    so it is encoded exactly once with the rest of the response (plus a text
+    copy if STRUCTURED_TEXT_FALLBACK is on). Older clients get it serialized
+    into a text content block.
+    """
+    if session.protocol_version >= STRUCTURED_CONTENT_PROTOCOL_VERSION:
+        content = []
+        if STRUCTURED_TEXT_FALLBACK:
+            content.append({"type": "text", "text": json_dumps_text(result)})
+        return {"content": content, "structuredContent": result}
+
+    return {"content": [{"type": "text", "text": json_dumps_text(result)}]}
+
+
+# Static parts of the initialize result, encoded once
+SERVER_INFO_JSON = json_dumps({"name": "graphiti-memory", "version": "0.1.2"})
+CAPABILITIES_JSON = json_dumps({"tools": {}})
+
+
+def handle_initialize(session, request_id, params):
+    """Build the initialize response."""
     logger.info("Handling initialize request")
 
-    response = {
+    session.protocol_version = negotiate_protocol_version(params.get("protocolVersion"))
+    logger.info(f"Negotiated protocol version: {session.protocol_version}")
+
+    server_info = extend_json_object(SERVER_INFO_JSON, {
+        "graphiti_status": graphiti_status(),
+        "initialization_error": initialization_error,
+        "graphiti_retry_in_seconds": graphiti_retry_in()
+    })
+    return raw_response(
+        request_id,
+        b'{"protocolVersion":' + json_dumps(session.protocol_version)
+        + b',"capabilities":' + CAPABILITIES_JSON
+        + b',"serverInfo":' + server_info + b'}'
+    )
+
+
+def handle_tools_list(request_id):
+    """Build the tools/list response.
+
+    The tool list is encoded once at startup; only the connection status is
+    encoded per call.
+    """
+    logger.info("Handling tools/list request")
+
+    return raw_response(request_id, extend_json_object(TOOL_LIST_RESULT_JSON, {
+        "graphiti_status": graphiti_status(),
+        "graphiti_retry_in_seconds": graphiti_retry_in()
+    }))
+
+
+def send_progress(session, progress_token, progress, total=None, message=None):
+    """Send notifications/progress for a request that asked for it.
+
+    Best effort: progress is dropped rather than waited for when the client's
+    output is backed up, so a slow reader never stalls a tool call or a queue
+    worker holding episode_semaphore.
+    """
+    if progress_token is None:
+        return
+
+    params = {"progressToken": progress_token, "progress": progress}
+    if total is not None:
+        params["total"] = total
+    if message:
+        params["message"] = message
+
+    session.notify({
         "jsonrpc": "2.0",
-        "id": request_id,
-        "result": {
-            "protocolVersion": "2024-11-05",
-            "capabilities": {
-                "tools": {}
-            },
-            "serverInfo": {
-                "name": "graphiti-memory",
-                "version": "0.1.2",
-                "graphiti_status": "connected" if graphiti_connected else "disconnected",
-                "initialization_error": initialization_error
-            }
+        "method": "notifications/progress",
+        "params": params
+    }, progress_token)
+
+
+class ToolCallError(Exception):
+    """A tools/call failure reported as a JSON-RPC error instead of a tool result."""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class ToolCall:
+    """One tools/call request on its way through the middleware pipeline."""
+
+    def __init__(self, session, request_id, tool, arguments, progress_token=None):
+        self.session = session
+        self.request_id = request_id
+        self.tool = tool
+        self.arguments = arguments
+        self.progress_token = progress_token
+
+    def progress(self, progress, total=None, message=None):
+        """Report progress, if the client asked for it and is still waiting for the result."""
+        if self.request_id not in self.session.in_flight:
+            # MCP only allows progress for requests that are still in progress
+            return
+        send_progress(self.session, self.progress_token, progress, total, message)
+
+
+JSON_SCHEMA_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+
+def _matches_type(value, expected):
+    # bool is an int subclass, but true is not a valid integer argument
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    return isinstance(value, expected)
+
+
+def compile_schema(schema):
+    """Compile a tool input schema into a validator function.
+
+    Only the subset of JSON Schema used by the tool schemas is checked:
+    required properties, property types, array item types (objects in arrays
+    recursively) and enums. The validator returns an error message, or None
+    if the arguments are valid. Arguments that are null count as absent.
+    """
+    required = tuple(schema.get("required", ()))
+    checks = []
+    for name, spec in schema.get("properties", {}).items():
+        item_spec = spec.get("items") or {}
+        checks.append((
+            name,
+            spec.get("type"),
+            JSON_SCHEMA_TYPES.get(spec.get("type")),
+            JSON_SCHEMA_TYPES.get(item_spec.get("type")),
+            compile_schema(item_spec) if "properties" in item_spec else None,
+            tuple(spec["enum"]) if "enum" in spec else None,
+        ))
+
+    def validate(arguments):
+        if not isinstance(arguments, dict):
+            return "arguments must be an object"
+        for name in required:
+            if arguments.get(name) is None:
+                return f"missing required argument '{name}'"
+        for name, type_name, expected, item_type, validate_item, choices in checks:
+            value = arguments.get(name)
+            if value is None:
+                continue
+            if expected is not None and not _matches_type(value, expected):
+                return f"argument '{name}' must be of type {type_name}"
+            if item_type is not None and not all(_matches_type(item, item_type) for item in value):
+                return f"argument '{name}' has items of the wrong type"
+            if validate_item is not None:
+                for index, item in enumerate(value):
+                    problem = validate_item(item)
+                    if problem:
+                        return f"'{name}[{index}]': {problem}"
+            if choices is not None and value not in choices:
+                return f"argument '{name}' must be one of {', '.join(map(str, choices))}"
+        return None
+
+    return validate
+
+
+TIMEOUT_MS_PROPERTY = {
+    "type": "integer",
+    "description": "Optional deadline for this call in milliseconds (capped by the server's limit)"
+}
+
+
+class Tool:
+    """A registered MCP tool: schema, compiled validator, defaults and handler.
+
+    Handlers are called as handler(call, arguments) with defaults already
+    filled in, and return the tool's result dict.
+    """
+
+    def __init__(self, name, description, handler, properties=None, required=(), defaults=None,
+                 requires_graphiti=True):
+        self.name = name
+        self.handler = handler
+        self.defaults = defaults or {}
+        self.requires_graphiti = requires_graphiti
+        self.input_schema = {
+            "type": "object",
+            "properties": {**(properties or {}), "timeout_ms": TIMEOUT_MS_PROPERTY},
+            "required": list(required)
+        }
+        self.definition = {
+            "name": name,
+            "description": description,
+            "inputSchema": self.input_schema
         }
+        self.validate = compile_schema(self.input_schema)
+        self.timeout = TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT)
+        self.is_search = name in SEARCH_TOOLS
+
+    def bind_arguments(self, arguments):
+        """Return the call's arguments with the tool's defaults filled in."""
+        bound = dict(self.defaults)
+        bound.update((key, value) for key, value in arguments.items() if value is not None)
+        return bound
+
+
+async def tool_add_memory(call, arguments):
+    episode = QueuedEpisode(
+        arguments["name"],
+        arguments["episode_body"],
+        arguments["group_id"],
+        arguments["source"],
+        arguments["source_description"],
+    )
+    group_id = episode.group_id
+
+    _, duplicates = await find_duplicates(group_id, [episode])
+    if duplicates:
+        _, state, existing_uuid, original = duplicates[0]
+        existing = "a queued episode" if state == "queued" else "an ingested episode"
+        logger.info(f"Episode '{episode.name}' duplicates {existing}; skipping")
+        return {
+            "success": True,
+            "duplicate": True,
+            "message": f"Episode '{episode.name}' duplicates {existing}; not queued again",
+            "episode_uuid": existing_uuid,
+            "ticket": original.status.ticket if original is not None and original.status else None
+        }
+
+    # Shed the episode if the queues are full; the slot is held from here on,
+    # so concurrent calls cannot overfill them while the journal commits
+    reserve_episodes(group_id, 1)
+    track_queued(episode)
+    ticket = track_ingestion(episode)
+    try:
+        # Journal the episode before acknowledging it; concurrent calls share a commit
+        if episode_journal is not None:
+            episode.journal_id = await episode_journal.append(group_id, episode.to_record())
+    except BaseException:
+        # Never accepted, so no ticket either
+        adjust_queued_episodes(group_id, -1)
+        untrack_queued(episode)
+        ingestion_status.pop(ticket, None)
+        raise
+
+    # Fetched only now: the worker may have gone idle and been evicted meanwhile
+    queue = episode_queue(group_id)
+    queue.put_nowait(episode)
+
+    queue_position = queued_episodes.get(group_id, 0)
+    call.progress(1, 1, f"Queued at position {queue_position}")
+
+    return {
+        "success": True,
+        "message": f"Episode '{episode.name}' queued for processing",
+        "queue_position": queue_position,
+        "ticket": ticket
     }
-    send_response(response)
 
 
-def handle_tools_list(request_id):
-    """Handle tools/list request."""
-    logger.info("Handling tools/list request")
+def parse_reference_time(value):
+    """Parse an ISO 8601 timestamp into an aware datetime, assuming UTC if it has no offset."""
+    if value.endswith(("Z", "z")):
+        # fromisoformat() only accepts a "Z" suffix from Python 3.11 on
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
 
-    tools = [
-        {
-            "name": "add_memory",
-            "description": "Add an episode/memory to the knowledge graph. This is the primary way to add information.",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "name": {
-                        "type": "string",
-                        "description": "Name of the episode"
-                    },
-                    "episode_body": {
-                        "type": "string",
-                        "description": "Content of the episode (text, message, or JSON)"
-                    },
-                    "group_id": {
-                        "type": "string",
-                        "description": "Optional group ID for organizing data"
-                    },
-                    "source": {
-                        "type": "string",
-                        "enum": ["text", "message", "json"],
-                        "description": "Source type (default: text)"
-                    },
-                    "source_description": {
-                        "type": "string",
-                        "description": "Optional description of the source"
-                    }
-                },
-                "required": ["name", "episode_body"]
+
+async def tool_add_memories(call, arguments):
+    group_id = arguments["group_id"]
+    inputs = []
+    for index, item in enumerate(arguments["episodes"]):
+        reference_time = None
+        if item.get("reference_time") is not None:
+            try:
+                reference_time = parse_reference_time(item["reference_time"])
+            except ValueError:
+                raise ToolCallError(
+                    -32602,
+                    f"Invalid params: 'episodes[{index}]': reference_time must be an ISO 8601 timestamp",
+                    {"tool": call.tool.name},
+                )
+        inputs.append(QueuedEpisode(
+            item["name"],
+            item["episode_body"],
+            group_id,
+            item.get("source") or "text",
+            item.get("source_description") or "",
+            reference_time,
+        ))
+    episodes, duplicates = await find_duplicates(group_id, inputs)
+    if duplicates:
+        logger.info(f"Skipping {len(duplicates)} duplicate episodes for group_id {group_id}")
+    if not episodes:
+        return {
+            "success": True,
+            "message": "No new episodes to queue",
+            "queued": 0,
+            "duplicates": len(duplicates),
+            **episode_results(inputs, duplicates)
+        }
+
+    chunks = [episodes[i:i + EPISODE_BULK_SIZE] for i in range(0, len(episodes), EPISODE_BULK_SIZE)]
+
+    # All or nothing: shed the call unless every episode fits under the limits
+    reserve_episodes(group_id, len(episodes))
+    for episode in episodes:
+        track_queued(episode)
+        track_ingestion(episode)
+    try:
+        if episode_journal is not None:
+            # Appended concurrently so they land in the same journal commit
+            journal_ids = await asyncio.gather(
+                *(episode_journal.append(group_id, episode.to_record()) for episode in episodes)
+            )
+            for episode, journal_id in zip(episodes, journal_ids):
+                episode.journal_id = journal_id
+    except BaseException:
+        adjust_queued_episodes(group_id, -len(episodes))
+        for episode in episodes:
+            untrack_queued(episode)
+            ingestion_status.pop(episode.status.ticket, None)
+        raise
+
+    # The worker may have gone idle and been evicted while the journal committed
+    queue = episode_queue(group_id)
+    for chunk in chunks:
+        queue.put_nowait(chunk)
+
+    queue_position = queued_episodes.get(group_id, 0)
+    call.progress(1, 1, f"Queued {len(episodes)} episodes in {len(chunks)} chunks")
+
+    return {
+        "success": True,
+        "message": f"{len(episodes)} episodes queued for bulk processing",
+        "queued": len(episodes),
+        "duplicates": len(duplicates),
+        "chunks": len(chunks),
+        "queue_position": queue_position,
+        **episode_results(inputs, duplicates)
+    }
+
+
+def episode_results(inputs, duplicates):
+    """Describe each input episode of an add_memories call, in input order.
+
+    Queued episodes and copies of queued ones carry a ticket; copies of
+    ingested episodes carry the existing episode_uuid when known. Returns
+    "results" and the matching "tickets" list (null where there is none).
+    """
+    copies = {id(episode): (existing_uuid, original) for episode, _, existing_uuid, original in duplicates}
+    results = []
+    for episode in inputs:
+        if id(episode) not in copies:
+            results.append({"name": episode.name, "duplicate": False, "ticket": episode.status.ticket})
+            continue
+        existing_uuid, original = copies[id(episode)]
+        results.append({
+            "name": episode.name,
+            "duplicate": True,
+            "ticket": original.status.ticket if original is not None and original.status else None,
+            "episode_uuid": existing_uuid,
+        })
+    return {"tickets": [result["ticket"] for result in results], "results": results}
+
+
+async def tool_get_ingestion_status(call, arguments):
+    tickets = arguments.get("tickets")
+    if tickets is not None:
+        statuses = []
+        for ticket in tickets:
+            status = ingestion_status.get(ticket)
+            statuses.append(status.to_dict() if status else {"ticket": ticket, "state": "unknown"})
+        return {
+            "statuses": statuses,
+            "success": True
+        }
+
+    # No tickets: summarize the backlog
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    oldest_queued = None
+    for status in ingestion_status.values():
+        counts[status.state] += 1
+        if status.state == "queued" and (oldest_queued is None or status.queued_at < oldest_queued):
+            oldest_queued = status.queued_at
+    return {
+        **counts,
+        "oldest_queued_wait_ms": None if oldest_queued is None else int((time.monotonic() - oldest_queued) * 1000),
+        "queue_depths": dict(queued_episodes),
+        "avg_episode_ms": int(episode_seconds_avg * 1000),
+        "success": True
+    }
+
+
+async def tool_search_memory_nodes(call, arguments):
+    query = arguments["query"]
+
+    search_config = NODE_HYBRID_SEARCH_RRF.model_copy(deep=True)
+    search_config.limit = arguments["max_nodes"]
+
+    call.progress(0, 2, "Searching nodes")
+    search_results = await graphiti_client._search(
+        query=query,
+        config=search_config,
+        group_ids=arguments["group_ids"],
+    )
+    call.progress(1, 2, "Formatting results")
+
+    nodes = []
+    if search_results.nodes:
+        for node in search_results.nodes:
+            nodes.append({
+                "uuid": node.uuid,
+                "name": node.name,
+                "summary": getattr(node, 'summary', ''),
+                "labels": getattr(node, 'labels', []),
+                "group_id": node.group_id,
+                "created_at": node.created_at,
+            })
+
+    return {
+        "query": query,
+        "nodes": nodes,
+        "total": len(nodes),
+        "success": True
+    }
+
+
+async def tool_search_memory_facts(call, arguments):
+    query = arguments["query"]
+
+    call.progress(0, 2, "Searching facts")
+    relevant_edges = await graphiti_client.search(
+        group_ids=arguments["group_ids"],
+        query=query,
+        num_results=arguments["max_facts"],
+    )
+    call.progress(1, 2, "Formatting results")
+
+    facts = []
+    if relevant_edges:
+        for edge in relevant_edges:
+            facts.append(edge.model_dump(exclude={'fact_embedding'}))
+
+    return {
+        "query": query,
+        "facts": facts,
+        "total": len(facts),
+        "success": True
+    }
+
+
+async def tool_get_episodes(call, arguments):
+    group_id = arguments["group_id"]
+
+    episodes = await graphiti_client.retrieve_episodes(
+        group_ids=[group_id],
+        last_n=arguments["last_n"],
+        reference_time=datetime.now(timezone.utc)
+    )
+
+    formatted_episodes = []
+    if episodes:
+        for episode in episodes:
+            formatted_episodes.append(episode.model_dump())
+
+    return {
+        "group_id": group_id,
+        "episodes": formatted_episodes,
+        "total": len(formatted_episodes),
+        "success": True
+    }
+
+
+async def tool_delete_episode(call, arguments):
+    uuid = arguments["uuid"]
+    episodic_node = await EpisodicNode.get_by_uuid(graphiti_client.driver, uuid)
+    await episodic_node.delete(graphiti_client.driver)
+
+    # Let the same content be added again
+    for digest in [digest for digest, (known, _) in ingested_hashes.items() if known == uuid]:
+        del ingested_hashes[digest]
+
+    return {
+        "success": True,
+        "message": f"Episode with UUID {uuid} deleted successfully"
+    }
+
+
+async def tool_delete_entity_edge(call, arguments):
+    uuid = arguments["uuid"]
+    entity_edge = await EntityEdge.get_by_uuid(graphiti_client.driver, uuid)
+    await entity_edge.delete(graphiti_client.driver)
+
+    return {
+        "success": True,
+        "message": f"Entity edge with UUID {uuid} deleted successfully"
+    }
+
+
+async def tool_get_entity_edge(call, arguments):
+    entity_edge = await EntityEdge.get_by_uuid(graphiti_client.driver, arguments["uuid"])
+
+    return {
+        "success": True,
+        "edge": entity_edge.model_dump(exclude={'fact_embedding'})
+    }
+
+
+async def tool_clear_graph(call, arguments):
+    # clear_data removes nodes, not indices, so the DDL is only needed
+    # if the schema was not current to begin with
+    try:
+        schema_current = await read_schema_fingerprint() == schema_fingerprint()
+    except Exception as e:
+        logger.warning(f"Could not read schema fingerprint: {e}")
+        schema_current = False
+
+    await clear_data(graphiti_client.driver)
+    ingested_hashes.clear()
+
+    if schema_current:
+        await write_schema_fingerprint(schema_fingerprint())
+    else:
+        await ensure_graph_schema(force=True)
+
+    return {
+        "success": True,
+        "message": "Graph cleared successfully" + ("" if schema_current else " and indices rebuilt")
+    }
+
+
+async def tool_rebuild_indices(call, arguments):
+    await ensure_graph_schema(force=True)
+
+    return {
+        "success": True,
+        "message": "Indices and constraints rebuilt"
+    }
+
+
+GROUP_IDS_PROPERTY = {
+    "type": "array",
+    "items": {"type": "string"},
+    "description": "Optional list of group IDs to filter results"
+}
+
+# Tool registry, built once at import; tools/list is generated from it
+TOOLS = {tool.name: tool for tool in (
+    Tool(
+        "add_memory",
+        "Add an episode/memory to the knowledge graph. This is the primary way to add information.",
+        tool_add_memory,
+        properties={
+            "name": {
+                "type": "string",
+                "description": "Name of the episode"
+            },
+            "episode_body": {
+                "type": "string",
+                "description": "Content of the episode (text, message, or JSON)"
+            },
+            "group_id": {
+                "type": "string",
+                "description": "Optional group ID for organizing data"
+            },
+            "source": {
+                "type": "string",
+                "enum": ["text", "message", "json"],
+                "description": "Source type (default: text)"
+            },
+            "source_description": {
+                "type": "string",
+                "description": "Optional description of the source"
             }
         },
-        {
-            "name": "search_memory_nodes",
-            "description": "Search for nodes (entities) in the knowledge graph",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query"
-                    },
-                    "group_ids": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Optional list of group IDs to filter results"
+        required=["name", "episode_body"],
+        defaults={"group_id": DEFAULT_GROUP_ID, "source": "text", "source_description": ""},
+    ),
+    Tool(
+        "add_memories",
+        "Add many episodes to the knowledge graph at once, e.g. to import a conversation history. "
+        "Episodes are extracted in bulk, which is much faster than one add_memory call each.",
+        tool_add_memories,
+        properties={
+            "episodes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {
+                            "type": "string",
+                            "description": "Name of the episode"
+                        },
+                        "episode_body": {
+                            "type": "string",
+                            "description": "Content of the episode (text, message, or JSON)"
+                        },
+                        "source": {
+                            "type": "string",
+                            "enum": ["text", "message", "json"],
+                            "description": "Source type (default: text)"
+                        },
+                        "source_description": {
+                            "type": "string",
+                            "description": "Optional description of the source"
+                        },
+                        "reference_time": {
+                            "type": "string",
+                            "format": "date-time",
+                            "description": "When the episode happened, as ISO 8601 (default: now; UTC if no offset)"
+                        }
                     },
-                    "max_nodes": {
-                        "type": "integer",
-                        "description": "Maximum number of nodes to return (default: 10)"
-                    }
+                    "required": ["name", "episode_body"]
                 },
-                "required": ["query"]
+                "description": "Episodes to add, oldest first"
+            },
+            "group_id": {
+                "type": "string",
+                "description": "Optional group ID for organizing data"
             }
         },
-        {
-            "name": "search_memory_facts",
-            "description": "Search for facts (relationships) in the knowledge graph",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query"
-                    },
-                    "group_ids": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Optional list of group IDs to filter results"
-                    },
-                    "max_facts": {
-                        "type": "integer",
-                        "description": "Maximum number of facts to return (default: 10)"
-                    }
-                },
-                "required": ["query"]
+        required=["episodes"],
+        defaults={"group_id": DEFAULT_GROUP_ID},
+    ),
+    Tool(
+        "get_ingestion_status",
+        "Report the ingestion state (queued/running/done/failed) of episodes by the ticket add_memory "
+        "returned, with queue wait and processing time. Without tickets, summarizes the ingestion backlog.",
+        tool_get_ingestion_status,
+        properties={
+            "tickets": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Tickets returned by add_memory or add_memories"
             }
         },
-        {
-            "name": "get_episodes",
-            "description": "Get recent episodes for a group",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "group_id": {
-                        "type": "string",
-                        "description": "Group ID to retrieve episodes from"
-                    },
-                    "last_n": {
-                        "type": "integer",
-                        "description": "Number of recent episodes to retrieve (default: 10)"
-                    }
-                },
-                "required": []
+        requires_graphiti=False,
+    ),
+    Tool(
+        "search_memory_nodes",
+        "Search for nodes (entities) in the knowledge graph",
+        tool_search_memory_nodes,
+        properties={
+            "query": {
+                "type": "string",
+                "description": "Search query"
+            },
+            "group_ids": GROUP_IDS_PROPERTY,
+            "max_nodes": {
+                "type": "integer",
+                "description": "Maximum number of nodes to return (default: 10)"
             }
         },
-        {
-            "name": "delete_episode",
-            "description": "Delete an episode from the knowledge graph",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "uuid": {
-                        "type": "string",
-                        "description": "UUID of the episode to delete"
-                    }
-                },
-                "required": ["uuid"]
+        required=["query"],
+        defaults={"group_ids": [DEFAULT_GROUP_ID], "max_nodes": 10},
+    ),
+    Tool(
+        "search_memory_facts",
+        "Search for facts (relationships) in the knowledge graph",
+        tool_search_memory_facts,
+        properties={
+            "query": {
+                "type": "string",
+                "description": "Search query"
+            },
+            "group_ids": GROUP_IDS_PROPERTY,
+            "max_facts": {
+                "type": "integer",
+                "description": "Maximum number of facts to return (default: 10)"
             }
         },
-        {
-            "name": "delete_entity_edge",
-            "description": "Delete an entity edge (fact) from the knowledge graph",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "uuid": {
-                        "type": "string",
-                        "description": "UUID of the entity edge to delete"
-                    }
-                },
-                "required": ["uuid"]
+        required=["query"],
+        defaults={"group_ids": [DEFAULT_GROUP_ID], "max_facts": 10},
+    ),
+    Tool(
+        "get_episodes",
+        "Get recent episodes for a group",
+        tool_get_episodes,
+        properties={
+            "group_id": {
+                "type": "string",
+                "description": "Group ID to retrieve episodes from"
+            },
+            "last_n": {
+                "type": "integer",
+                "description": "Number of recent episodes to retrieve (default: 10)"
             }
         },
-        {
-            "name": "get_entity_edge",
-            "description": "Get an entity edge by UUID",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "uuid": {
-                        "type": "string",
-                        "description": "UUID of the entity edge to retrieve"
-                    }
-                },
-                "required": ["uuid"]
+        defaults={"group_id": DEFAULT_GROUP_ID, "last_n": 10},
+    ),
+    Tool(
+        "delete_episode",
+        "Delete an episode from the knowledge graph",
+        tool_delete_episode,
+        properties={
+            "uuid": {
+                "type": "string",
+                "description": "UUID of the episode to delete"
             }
         },
-        {
-            "name": "clear_graph",
-            "description": "Clear all data from the knowledge graph (DESTRUCTIVE)",
-            "inputSchema": {
-                "type": "object",
-                "properties": {},
-                "required": []
+        required=["uuid"],
+    ),
+    Tool(
+        "delete_entity_edge",
+        "Delete an entity edge (fact) from the knowledge graph",
+        tool_delete_entity_edge,
+        properties={
+            "uuid": {
+                "type": "string",
+                "description": "UUID of the entity edge to delete"
             }
-        }
-    ]
-
-    response = {
+        },
+        required=["uuid"],
+    ),
+    Tool(
+        "get_entity_edge",
+        "Get an entity edge by UUID",
+        tool_get_entity_edge,
+        properties={
+            "uuid": {
+                "type": "string",
+                "description": "UUID of the entity edge to retrieve"
+            }
+        },
+        required=["uuid"],
+    ),
+    Tool(
+        "clear_graph",
+        "Clear all data from the knowledge graph (DESTRUCTIVE)",
+        tool_clear_graph,
+    ),
+    Tool(
+        "rebuild_indices",
+        "Force a rebuild of the graph's indices and constraints",
+        tool_rebuild_indices,
+    ),
+)}
+TOOL_LIST = [tool.definition for tool in TOOLS.values()]
+TOOL_LIST_RESULT_JSON = json_dumps({"tools": TOOL_LIST})
+
+
+def error_response(request_id, code, message):
+    """Build a JSON-RPC error response."""
+    return {
         "jsonrpc": "2.0",
         "id": request_id,
-        "result": {
-            "tools": tools,
-            "graphiti_status": "connected" if graphiti_connected else "disconnected"
+        "error": {
+            "code": code,
+            "message": message
         }
     }
-    send_response(response)
 
 
-async def handle_tool_call_async(request_id, tool_name, arguments):
-    """Handle tools/call request asynchronously."""
-    logger.info(f"Handling tool call: {tool_name} with args: {arguments}")
+def record_service_time(kind, seconds):
+    """Fold a completed search or episode into its moving average."""
+    global search_seconds_avg, episode_seconds_avg
+    if kind == "search":
+        search_seconds_avg = 0.8 * search_seconds_avg + 0.2 * seconds
+    else:
+        episode_seconds_avg = 0.8 * episode_seconds_avg + 0.2 * seconds
+
+
+def busy_error(reason, retry_after_seconds):
+    """Build a "server busy" error carrying a retry-after hint."""
+    return ToolCallError(ERROR_SERVER_BUSY, f"Server busy: {reason}", {
+        "reason": reason,
+        "retry_after_ms": max(100, int(retry_after_seconds * 1000)),
+    })
+
+
+def adjust_queued_episodes(group_id, delta):
+    """Add delta to the group's count of accepted but unprocessed episodes."""
+    count = queued_episodes.get(group_id, 0) + delta
+    if count > 0:
+        queued_episodes[group_id] = count
+    else:
+        queued_episodes.pop(group_id, None)
+
+
+def episode_capacity():
+    """Return the most episodes a single call can ever have queued at once."""
+    return min(MAX_QUEUED_EPISODES_PER_GROUP, MAX_QUEUED_EPISODES)
+
+
+def reserve_episodes(group_id, count):
+    """Count episodes against the queue limits, or raise a busy error if they do not fit.
+
+    The caller gives the slots back with adjust_queued_episodes() if it ends
+    up not queuing the episodes; otherwise the worker does once they are processed.
+    """
+    queued = queued_episodes.get(group_id, 0)
+    if queued + count > MAX_QUEUED_EPISODES_PER_GROUP:
+        logger.warning(f"Shedding {count} episodes for group_id {group_id}: {queued} already queued")
+        # The group's worker is sequential, so this is the time to drain the overflow
+        overflow = queued + count - MAX_QUEUED_EPISODES_PER_GROUP
+        raise busy_error(f"episode queue for group '{group_id}' is full", episode_seconds_avg * overflow)
+    total_queued = sum(queued_episodes.values())
+    if total_queued + count > MAX_QUEUED_EPISODES:
+        logger.warning(f"Shedding {count} episodes: {total_queued} episodes queued in total")
+        active_workers = sum(1 for running in queue_workers.values() if running)
+        parallelism = max(1, min(active_workers, MAX_CONCURRENT_EPISODES))
+        overflow = total_queued + count - MAX_QUEUED_EPISODES
+        raise busy_error("episode queues are full", episode_seconds_avg * overflow / parallelism)
+    queued_episodes[group_id] = queued + count
+
+
+def check_admission(tool, arguments):
+    """Raise a busy error if accepting this call would exceed a limit."""
+    if tool.is_search and inflight_searches >= MAX_INFLIGHT_SEARCHES:
+        logger.warning(f"Shedding {tool.name}: {inflight_searches} searches in flight")
+        raise busy_error("too many searches in flight", search_seconds_avg)
+
+    # Fast global check before deduplication; the tools reserve the exact
+    # number of new episodes against both limits once duplicates are dropped
+    if tool.name in EPISODE_TOOLS:
+        incoming = len(arguments.get("episodes") or ()) if tool.name == "add_memories" else 1
+        capacity = episode_capacity()
+        if incoming > capacity:
+            # Retrying can never help, so this is not a busy error
+            raise ToolCallError(
+                -32602,
+                f"Invalid params: {incoming} episodes exceed the queue capacity of {capacity}; split the call",
+                {"tool": tool.name, "max_episodes": capacity},
+            )
+        total_queued = sum(queued_episodes.values())
+        if total_queued + incoming > MAX_QUEUED_EPISODES:
+            logger.warning(f"Shedding {tool.name}: {total_queued} episodes queued in total")
+            active_workers = sum(1 for running in queue_workers.values() if running)
+            parallelism = max(1, min(active_workers, MAX_CONCURRENT_EPISODES))
+            overflow = total_queued + incoming - MAX_QUEUED_EPISODES
+            raise busy_error("episode queues are full", episode_seconds_avg * overflow / parallelism)
 
-    if not graphiti_connected:
-        result_text = json.dumps({
-            "error": f"Graphiti not connected: {initialization_error}",
-            "solution": "Check Neo4j connection and credentials"
-        })
-        response = {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {
-                "content": [{"type": "text", "text": result_text}]
-            }
-        }
-        send_response(response)
-        return
 
+def tool_timeout(tool, arguments):
+    """Return the deadline in seconds for a call, honoring a smaller timeout_ms."""
     try:
-        from graphiti_core.nodes import EpisodeType, EpisodicNode
-        from graphiti_core.edges import EntityEdge
-        from graphiti_core.search.search_config_recipes import NODE_HYBRID_SEARCH_RRF
-        from graphiti_core.utils.maintenance.graph_data_operations import clear_data
-
-        default_group_id = os.environ.get('GRAPHITI_GROUP_ID', 'default')
-
-        # ADD_MEMORY tool
-        if tool_name == "add_memory":
-            name = arguments.get("name", "")
-            episode_body = arguments.get("episode_body", "")
-            group_id = arguments.get("group_id", default_group_id)
-            source = arguments.get("source", "text")
-            source_description = arguments.get("source_description", "")
-
-            # Map source type
-            source_type = EpisodeType.text
-            if source == "message":
-                source_type = EpisodeType.message
-            elif source == "json":
-                source_type = EpisodeType.json
-
-            # Define episode processing function
-            async def process_episode():
-                try:
-                    logger.info(f"Processing episode '{name}' for group_id: {group_id}")
-                    await graphiti_client.add_episode(
-                        name=name,
-                        episode_body=episode_body,
-                        source=source_type,
-                        source_description=source_description,
-                        group_id=group_id,
-                        reference_time=datetime.now(timezone.utc),
-                    )
-                    logger.info(f"Episode '{name}' processed successfully")
-                except Exception as e:
-                    logger.error(f"Error processing episode '{name}': {e}")
+        requested = float(arguments.get("timeout_ms")) / 1000
+    except (TypeError, ValueError):
+        return tool.timeout
+    return min(tool.timeout, requested) if requested > 0 else tool.timeout
 
-            # Initialize queue for this group_id if needed
-            if group_id not in episode_queues:
-                episode_queues[group_id] = asyncio.Queue()
 
-            # Add to queue
-            await episode_queues[group_id].put(process_episode)
+# Middleware wraps every tool call as layer(call, call_next). Each layer may
+# inspect the call, short-circuit with a result, raise ToolCallError, or await
+# call_next(call) for the rest of the pipeline.
 
-            # Start worker if not running
-            if not queue_workers.get(group_id, False):
-                asyncio.create_task(process_episode_queue(group_id))
+async def validate_arguments(call, call_next):
+    """Reject arguments that do not match the tool's schema, then apply defaults."""
+    problem = call.tool.validate(call.arguments)
+    if problem:
+        raise ToolCallError(-32602, f"Invalid params: {problem}", {"tool": call.tool.name})
+    call.arguments = call.tool.bind_arguments(call.arguments)
+    return await call_next(call)
 
-            result_text = json.dumps({
-                "success": True,
-                "message": f"Episode '{name}' queued for processing",
-                "queue_position": episode_queues[group_id].qsize()
-            })
 
-        # SEARCH_MEMORY_NODES tool
-        elif tool_name == "search_memory_nodes":
-            query = arguments.get("query", "")
-            group_ids = arguments.get("group_ids", [default_group_id])
-            max_nodes = arguments.get("max_nodes", 10)
+async def admit(call, call_next):
+    """Shed the call with a busy error when the server is overloaded."""
+    check_admission(call.tool, call.arguments)
+    return await call_next(call)
 
-            search_config = NODE_HYBRID_SEARCH_RRF.model_copy(deep=True)
-            search_config.limit = max_nodes
 
-            search_results = await graphiti_client._search(
-                query=query,
-                config=search_config,
-                group_ids=group_ids,
-            )
+async def enforce_deadline(call, call_next):
+    """Cancel the call if it overruns its deadline.
 
-            nodes = []
-            if search_results.nodes:
-                for node in search_results.nodes:
-                    nodes.append({
-                        "uuid": node.uuid,
-                        "name": node.name,
-                        "summary": getattr(node, 'summary', ''),
-                        "labels": getattr(node, 'labels', []),
-                        "group_id": node.group_id,
-                        "created_at": node.created_at.isoformat(),
-                    })
-
-            result_text = json.dumps({
-                "query": query,
-                "nodes": nodes,
-                "total": len(nodes),
-                "success": True
-            })
+    The deadline covers waiting for a concurrency slot too. Cancellation reaches
+    the pending Neo4j query (the driver drops the connection, rolling back the
+    transaction) and OpenAI request.
+    """
+    timeout = tool_timeout(call.tool, call.arguments)
+    try:
+        return await asyncio.wait_for(call_next(call), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Tool call {call.tool.name} timed out after {timeout}s")
+        raise ToolCallError(
+            ERROR_REQUEST_TIMEOUT,
+            f"Tool call timed out: {call.tool.name}",
+            {"tool": call.tool.name, "timeout_ms": int(timeout * 1000)},
+        )
 
-        # SEARCH_MEMORY_FACTS tool
-        elif tool_name == "search_memory_facts":
-            query = arguments.get("query", "")
-            group_ids = arguments.get("group_ids", [default_group_id])
-            max_facts = arguments.get("max_facts", 10)
 
-            relevant_edges = await graphiti_client.search(
-                group_ids=group_ids,
-                query=query,
-                num_results=max_facts,
-            )
+async def require_graphiti(call, call_next):
+    """Wait for background initialization; report the status if not connected."""
+    if not call.tool.requires_graphiti:
+        return await call_next(call)
 
-            facts = []
-            if relevant_edges:
-                for edge in relevant_edges:
-                    facts.append(edge.model_dump(
-                        mode='json',
-                        exclude={'fact_embedding'}
-                    ))
-
-            result_text = json.dumps({
-                "query": query,
-                "facts": facts,
-                "total": len(facts),
-                "success": True
-            })
+    await wait_for_graphiti()
 
-        # GET_EPISODES tool
-        elif tool_name == "get_episodes":
-            group_id = arguments.get("group_id", default_group_id)
-            last_n = arguments.get("last_n", 10)
+    if graphiti_connected:
+        return await call_next(call)
 
-            episodes = await graphiti_client.retrieve_episodes(
-                group_ids=[group_id],
-                last_n=last_n,
-                reference_time=datetime.now(timezone.utc)
-            )
+    if graphiti_status() == "initializing":
+        return {
+            "error": "Graphiti is still initializing",
+            "solution": "Retry shortly; the server is connecting to Neo4j"
+        }
+    return {
+        "error": f"Graphiti not connected: {initialization_error}",
+        "solution": "Check Neo4j connection and credentials",
+        "graphiti_status": graphiti_status(),
+        "reconnect_attempts": reconnect_attempts,
+        "retry_in_seconds": graphiti_retry_in()
+    }
 
-            formatted_episodes = []
-            if episodes:
-                for episode in episodes:
-                    formatted_episodes.append(episode.model_dump(mode='json'))
 
-            result_text = json.dumps({
-                "group_id": group_id,
-                "episodes": formatted_episodes,
-                "total": len(formatted_episodes),
-                "success": True
-            })
+async def limit_concurrency(call, call_next):
+    """Run the call once a concurrency slot is free."""
+    global inflight_searches
 
-        # DELETE_EPISODE tool
-        elif tool_name == "delete_episode":
-            uuid = arguments.get("uuid", "")
-            episodic_node = await EpisodicNode.get_by_uuid(graphiti_client.driver, uuid)
-            await episodic_node.delete(graphiti_client.driver)
+    if not call.tool.is_search:
+        async with tool_call_semaphore:
+            return await call_next(call)
 
-            result_text = json.dumps({
-                "success": True,
-                "message": f"Episode with UUID {uuid} deleted successfully"
-            })
+    # Searches count against the limit while they wait for a slot, too
+    inflight_searches += 1
+    try:
+        async with tool_call_semaphore:
+            return await call_next(call)
+    finally:
+        inflight_searches -= 1
 
-        # DELETE_ENTITY_EDGE tool
-        elif tool_name == "delete_entity_edge":
-            uuid = arguments.get("uuid", "")
-            entity_edge = await EntityEdge.get_by_uuid(graphiti_client.driver, uuid)
-            await entity_edge.delete(graphiti_client.driver)
 
-            result_text = json.dumps({
-                "success": True,
-                "message": f"Entity edge with UUID {uuid} deleted successfully"
-            })
+async def time_tool_call(call, call_next):
+    """Log each call's duration and feed search times into the retry-after estimate."""
+    started = time.monotonic()
+    try:
+        return await call_next(call)
+    finally:
+        elapsed = time.monotonic() - started
+        if call.tool.is_search:
+            record_service_time("search", elapsed)
+        logger.debug(f"Tool call {call.tool.name} took {elapsed * 1000:.1f}ms")
 
-        # GET_ENTITY_EDGE tool
-        elif tool_name == "get_entity_edge":
-            uuid = arguments.get("uuid", "")
-            entity_edge = await EntityEdge.get_by_uuid(graphiti_client.driver, uuid)
-            edge_data = entity_edge.model_dump(
-                mode='json',
-                exclude={'fact_embedding'}
-            )
 
-            result_text = json.dumps({
-                "success": True,
-                "edge": edge_data
-            })
+async def report_tool_errors(call, call_next):
+    """Turn a handler exception into an error result for the client."""
+    try:
+        return await call_next(call)
+    except ToolCallError:
+        raise
+    except Exception as e:
+        logger.error(f"Tool call failed: {e}", exc_info=True)
+        return {
+            "error": str(e),
+            "tool": call.tool.name
+        }
 
-        # CLEAR_GRAPH tool
-        elif tool_name == "clear_graph":
-            await clear_data(graphiti_client.driver)
-            await graphiti_client.build_indices_and_constraints()
 
-            result_text = json.dumps({
-                "success": True,
-                "message": "Graph cleared successfully and indices rebuilt"
-            })
+async def call_tool_handler(call):
+    return await call.tool.handler(call, call.arguments)
 
-        else:
-            result_text = json.dumps({
-                "error": f"Unknown tool: {tool_name}"
-            })
 
-    except Exception as e:
-        logger.error(f"Tool call failed: {e}", exc_info=True)
-        result_text = json.dumps({
-            "error": str(e),
-            "tool": tool_name
-        })
+def build_pipeline(middleware, endpoint):
+    """Compose middleware around endpoint, outermost layer first."""
+    for layer in reversed(middleware):
+        endpoint = functools.partial(layer, call_next=endpoint)
+    return endpoint
+
+
+TOOL_MIDDLEWARE = [
+    validate_arguments,
+    admit,
+    enforce_deadline,
+    require_graphiti,
+    limit_concurrency,
+    time_tool_call,
+    report_tool_errors,
+]
+tool_pipeline = build_pipeline(TOOL_MIDDLEWARE, call_tool_handler)
+
+
+async def run_tool_call(session, request_id, tool_name, arguments, progress_token=None):
+    """Run a tools/call request through the tool pipeline and build its response."""
+    logger.info(f"Handling tool call: {tool_name} with args: {arguments}")
+
+    tool = TOOLS.get(tool_name)
+    if tool is None:
+        result = {
+            "error": f"Unknown tool: {tool_name}"
+        }
+    else:
+        try:
+            result = await tool_pipeline(ToolCall(session, request_id, tool, arguments, progress_token))
+        except ToolCallError as e:
+            response = error_response(request_id, e.code, e.message)
+            if e.data is not None:
+                response["error"]["data"] = e.data
+            return response
 
     response = {
         "jsonrpc": "2.0",
         "id": request_id,
-        "result": {
-            "content": [{"type": "text", "text": result_text}]
-        }
+        "result": build_tool_result(session, result)
     }
-    send_response(response)
+    return response
 
 
-async def main_async():
-    """Async main loop to handle MCP protocol messages."""
-    logger.info("=" * 60)
-    logger.info("Graphiti-Memory MCP server starting...")
-    logger.info("=" * 60)
+def dispatch_tool_call(session, request_id, tool_name, arguments, progress_token=None):
+    """Start a tools/call request as its own task, tracked by JSON-RPC id."""
+    if request_id in session.in_flight:
+        logger.warning(f"Request id {request_id!r} reused while still in flight")
 
-    # Initialize Graphiti
-    await initialize_graphiti()
+    task = asyncio.create_task(run_tool_call(session, request_id, tool_name, arguments, progress_token))
+    session.in_flight[request_id] = task
 
-    # Process stdin line by line
-    loop = asyncio.get_event_loop()
+    def on_done(finished):
+        if session.in_flight.get(request_id) is finished:
+            del session.in_flight[request_id]
 
-    async def read_stdin():
-        """Read from stdin asynchronously."""
-        for line in sys.stdin:
-            yield line
+    task.add_done_callback(on_done)
+    return task
+
+
+def handle_cancelled(session, params):
+    """Cancel an in-flight tool call named by a notifications/cancelled message.
+
+    Cancelling the task raises CancelledError inside the pending Graphiti call;
+    the Neo4j driver then drops the connection, which rolls back the open
+    transaction, and the OpenAI HTTP request is aborted.
+    """
+    request_id = params.get("requestId")
+    task = session.in_flight.get(request_id)
+    if task is None:
+        logger.debug(f"Cancellation for unknown or finished request {request_id!r}")
+        return
+
+    logger.info(f"Cancelling request {request_id!r}: {params.get('reason', 'no reason given')}")
+    task.cancel()
+
+
+def start_tool_call(session, request):
+    """Dispatch a tools/call now and return a coroutine for its response.
+
+    Dispatching synchronously puts the call in session.in_flight before the
+    next input line is read, so a notifications/cancelled already buffered
+    right behind the request still finds it.
+    """
+    params = request.get("params") or {}
+    progress_token = (params.get("_meta") or {}).get("progressToken")
+    task = dispatch_tool_call(
+        session, request.get("id"), params.get("name", ""), params.get("arguments") or {}, progress_token
+    )
+    return await_tool_call(task)
+
+
+async def await_tool_call(task):
+    try:
+        await asyncio.wait({task})
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if task.cancelled():
+        # The client cancelled this request and expects no response
+        return None
+    return task.result()
+
+
+def start_request(session, request):
+    """Start handling one JSON-RPC message and return an awaitable for its response."""
+    if isinstance(request, dict) and request.get("method") == "tools/call" and "id" in request:
+        return start_tool_call(session, request)
+    return handle_request(session, request)
+
+
+def start_message(session, message):
+    """Start handling a decoded message or batch and return an awaitable for the response.
+
+    Tool calls, including those inside a batch, are dispatched before this
+    returns; everything else runs when the awaitable is awaited.
+    """
+    if isinstance(message, list):
+        return handle_batch(message, [start_request(session, request) for request in message])
+    return start_request(session, message)
+
+
+async def handle_request(session, request):
+    """Handle a single JSON-RPC message and return its response.
+
+    Notifications (messages without an id) never get a response, so None is
+    returned for them.
+    """
+    if not isinstance(request, dict):
+        return error_response(None, -32600, "Invalid Request")
+
+    is_notification = "id" not in request
+    request_id = request.get("id")
+    method = request.get("method", "")
+    params = request.get("params") or {}
+
+    if method == "initialize":
+        response = handle_initialize(session, request_id, params)
+
+    elif method == "tools/list":
+        response = handle_tools_list(request_id)
+
+    elif method == "tools/call":
+        response = await start_tool_call(session, request)
+
+    elif method == "notifications/cancelled":
+        handle_cancelled(session, params)
+        response = None
+
+    elif is_notification:
+        logger.debug(f"Ignoring notification: {method}")
+        response = None
+
+    else:
+        logger.warning(f"Unknown method: {method}")
+        response = error_response(request_id, -32601, f"Method not found: {method}")
+
+    return None if is_notification else response
 
-    async for line in read_stdin():
+
+async def handle_batch(requests, pending):
+    """Collect the responses to a JSON-RPC batch whose entries were started together."""
+    if not requests:
+        return error_response(None, -32600, "Invalid Request: empty batch")
+
+    results = await asyncio.gather(*pending, return_exceptions=True)
+
+    responses = []
+    for request, result in zip(requests, results):
+        if isinstance(result, asyncio.CancelledError):
+            continue
+        if isinstance(result, BaseException):
+            logger.error(f"Error handling batch entry: {result}", exc_info=result)
+            if isinstance(request, dict) and "id" in request:
+                responses.append(error_response(request["id"], -32603, f"Internal error: {result}"))
+        elif result is not None:
+            responses.append(result)
+
+    # A batch made only of notifications gets no response at all
+    return responses or None
+
+
+async def handle_message(session, message):
+    """Handle a decoded JSON-RPC message or batch and return the response."""
+    return await start_message(session, message)
+
+
+async def respond(session, pending):
+    """Await a started message and send whatever response it produced to the session."""
+    try:
+        response = await pending
+    except Exception as e:
+        logger.error(f"Error handling request: {e}", exc_info=True)
+        return
+    if response is not None:
+        await session.send(response)
+
+
+async def serve_lines(lines, writer):
+    """Serve one MCP client speaking newline-delimited JSON-RPC.
+
+    Used for stdin/stdout and for each daemon socket connection.
+    """
+    output_channel = OutputChannel(writer)
+    session = Session(send=output_channel.send, send_nowait=output_channel.send_nowait)
+    pending = set()
+
+    # Process input line by line; queue workers keep running between reads
+    async for line in lines:
         line = line.strip()
         if not line:
             continue
 
         try:
-            request = json.loads(line)
-            request_id = request.get("id", 1)
-            method = request.get("method", "")
-            params = request.get("params", {})
+            message = json_loads(line)
+        except ValueError as e:
+            logger.error(f"Failed to parse JSON: {e}")
+            await session.send(error_response(None, -32700, "Parse error"))
+            continue
+
+        started = start_message(session, message)
+        if isinstance(message, list) or (
+            isinstance(message, dict) and message.get("method") == "tools/call"
+        ):
+            # Tool calls and batches run concurrently; responses carry their ids
+            task = asyncio.create_task(respond(session, started))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        else:
+            await respond(session, started)
+
+    # Input closed: let in-flight requests deliver their responses
+    if pending:
+        logger.info(f"Waiting for {len(pending)} in-flight request(s)")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    await output_channel.close()
 
-            if method == "initialize":
-                handle_initialize(request_id)
 
-            elif method == "tools/list":
-                handle_tools_list(request_id)
+async def serve_stdio():
+    """Serve a single MCP client on stdin/stdout."""
+    await serve_lines(read_stdin_lines(), await open_stdout_writer())
 
-            elif method == "tools/call":
-                tool_name = params.get("name", "")
-                arguments = params.get("arguments", {})
-                # Handle tool call asynchronously
-                await handle_tool_call_async(request_id, tool_name, arguments)
 
+async def handle_daemon_connection(reader, writer):
+    """Serve one shim connection to the daemon."""
+    logger.info("Daemon client connected")
+    try:
+        await serve_lines(read_stream_lines(reader), writer)
+    except Exception as e:
+        logger.error(f"Daemon connection error: {e}", exc_info=True)
+    finally:
+        writer.close()
+        logger.info("Daemon client disconnected")
+
+
+async def serve_daemon(path):
+    """Serve many shim connections over a Unix domain socket."""
+    if os.path.exists(path):
+        try:
+            _, probe = await asyncio.open_unix_connection(path)
+        except OSError:
+            os.unlink(path)  # Stale socket from a daemon that did not shut down cleanly
+        else:
+            probe.close()
+            raise RuntimeError(f"Another daemon is already listening on {path}")
+
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    server = await asyncio.start_unix_server(handle_daemon_connection, path=path, limit=MAX_MESSAGE_BYTES)
+    os.chmod(path, 0o600)
+    logger.info(f"Daemon listening on {path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+HTTP_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    406: "Not Acceptable",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+}
+
+
+def _http_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _http_reply(writer, status, body=b"", content_type="application/json", headers=None, keep_alive=True):
+    all_headers = {
+        "Content-Type": content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    all_headers.update(headers or {})
+    writer.write(_http_head(status, all_headers) + body)
+    await writer.drain()
+
+
+def _sse_event(message):
+    return b"event: message\ndata: " + encode_message(message) + b"\n\n"
+
+
+def _origin_allowed(origin):
+    """Reject cross-site browser requests (DNS rebinding) unless explicitly allowed."""
+    if not origin or origin in HTTP_ALLOWED_ORIGINS:
+        return True
+    host = origin.split("://", 1)[-1].split("/", 1)[0].rsplit(":", 1)[0].strip("[]")
+    return host in ("localhost", "127.0.0.1", "::1")
+
+
+async def _http_sse_stream(session, writer):
+    """Hold a GET request open as an SSE stream of server-initiated messages."""
+    queue = asyncio.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+    session.send_message = queue.put
+    session.send_message_nowait = queue.put_nowait
+
+    writer.write(_http_head(200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Mcp-Session-Id": session.id,
+    }))
+    try:
+        await writer.drain()
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=15)
+            except asyncio.TimeoutError:
+                writer.write(b": keep-alive\n\n")
             else:
-                logger.warning(f"Unknown method: {method}")
-                error_response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {
-                        "code": -32601,
-                        "message": f"Method not found: {method}"
-                    }
-                }
-                send_response(error_response)
+                writer.write(_sse_event(message))
+            await writer.drain()
+            session.last_seen = time.monotonic()
+    except (ConnectionError, BrokenPipeError):
+        pass
+    finally:
+        if session.send_message == queue.put:
+            session.send_message = None
+            session.send_message_nowait = None
+
+
+def _request_progress_token(request):
+    params = request.get("params")
+    meta = params.get("_meta") if isinstance(params, dict) else None
+    token = meta.get("progressToken") if isinstance(meta, dict) else None
+    return token if isinstance(token, (str, int)) else None
+
+
+async def _http_post_stream(session, message, progress_tokens, writer, headers):
+    """Answer a POST with an SSE stream: its requests' progress, then the response.
+
+    The connection is closed once the response is written, which ends the
+    stream without chunked encoding.
+    """
+    queue = asyncio.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+    for token in progress_tokens:
+        session.request_streams[token] = queue.put_nowait
+    responder = asyncio.ensure_future(start_message(session, message))
+
+    writer.write(_http_head(200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "Connection": "close",
+        **headers,
+    }))
+    try:
+        await writer.drain()
+        while not responder.done():
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, responder}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                # Cancelling leaves any item it was about to take in the queue
+                getter.cancel()
+                continue
+            writer.write(_sse_event(getter.result()))
+            await writer.drain()
+    finally:
+        for token in progress_tokens:
+            if session.request_streams.get(token) == queue.put_nowait:
+                del session.request_streams[token]
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON: {e}")
-        except Exception as e:
-            logger.error(f"Error handling request: {e}", exc_info=True)
+    while not queue.empty():
+        writer.write(_sse_event(queue.get_nowait()))
+    response = responder.result()
+    if response is not None:
+        writer.write(_sse_event(response))
+    await writer.drain()
+
+
+async def _http_post(session_id, body, writer, keep_alive, accept=""):
+    """Handle a POST carrying a JSON-RPC message or batch; return whether to keep the connection."""
+    try:
+        message = json_loads(body)
+    except ValueError:
+        await _http_reply(writer, 400, json_dumps(error_response(None, -32700, "Parse error")), keep_alive=keep_alive)
+        return keep_alive
+
+    headers = {}
+    if isinstance(message, dict) and message.get("method") == "initialize":
+        session = Session()
+        session.request_streams = {}
+        http_sessions[session.id] = session
+        headers["Mcp-Session-Id"] = session.id
+        logger.info(f"HTTP session {session.id} created ({len(http_sessions)} active)")
+    else:
+        session = http_sessions.get(session_id)
+        if session is None:
+            status = 404 if session_id else 400
+            error = error_response(None, -32000, "Unknown or missing Mcp-Session-Id")
+            await _http_reply(writer, status, json_dumps(error), keep_alive=keep_alive)
+            return keep_alive
+
+    session.last_seen = time.monotonic()
+    entries = message if isinstance(message, list) else [message]
+    requests = [entry for entry in entries if isinstance(entry, dict) and "method" in entry and "id" in entry]
+
+    # Progress for a request belongs on the response to that request
+    progress_tokens = [token for token in map(_request_progress_token, requests) if token is not None]
+    if progress_tokens and "text/event-stream" in accept:
+        await _http_post_stream(session, message, progress_tokens, writer, headers)
+        return False
+
+    response = await handle_message(session, message)
+
+    if response is not None:
+        await _http_reply(writer, 200, encode_message(response), headers=headers, keep_alive=keep_alive)
+    elif requests:
+        # Every request was cancelled, so there is nothing to send; 202 is
+        # reserved for POSTs of only notifications and responses
+        await _http_reply(writer, 200, content_type="text/event-stream", headers=headers, keep_alive=keep_alive)
+    else:
+        await _http_reply(writer, 202, headers=headers, keep_alive=keep_alive)
+    return keep_alive
+
+
+async def handle_http_connection(reader, writer):
+    """Serve MCP streamable HTTP requests on one TCP connection."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                await _http_reply(writer, 400, keep_alive=False)
+                return
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+            if "chunked" in headers.get("transfer-encoding", "").lower():
+                await _http_reply(writer, 411, keep_alive=False)
+                return
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_MESSAGE_BYTES:
+                await _http_reply(writer, 413, keep_alive=False)
+                return
+            body = await reader.readexactly(length) if length else b""
+
+            if target.split("?", 1)[0] != HTTP_PATH:
+                await _http_reply(writer, 404, keep_alive=keep_alive)
+                continue
+            if not _origin_allowed(headers.get("origin")):
+                await _http_reply(writer, 403, keep_alive=keep_alive)
+                continue
+
+            session_id = headers.get("mcp-session-id")
+
+            if method == "POST":
+                keep_alive = await _http_post(session_id, body, writer, keep_alive, headers.get("accept", ""))
+
+            elif method == "GET":
+                session = http_sessions.get(session_id)
+                if session is None:
+                    await _http_reply(writer, 404 if session_id else 400, keep_alive=keep_alive)
+                elif "text/event-stream" not in headers.get("accept", ""):
+                    await _http_reply(writer, 406, keep_alive=keep_alive)
+                else:
+                    await _http_sse_stream(session, writer)
+                    return
+
+            elif method == "DELETE":
+                session = http_sessions.pop(session_id, None)
+                if session is None:
+                    await _http_reply(writer, 404, keep_alive=keep_alive)
+                else:
+                    session.close()
+                    logger.info(f"HTTP session {session.id} terminated by client")
+                    await _http_reply(writer, 200, keep_alive=keep_alive)
+
+            else:
+                await _http_reply(writer, 405, headers={"Allow": "GET, POST, DELETE"}, keep_alive=keep_alive)
+
+            if not keep_alive:
+                return
+
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+        logger.debug(f"HTTP connection closed: {e}")
+    except Exception as e:
+        logger.error(f"HTTP connection error: {e}", exc_info=True)
+    finally:
+        writer.close()
+
+
+async def expire_http_sessions():
+    """Drop HTTP sessions whose client has gone quiet for HTTP_SESSION_TTL seconds."""
+    while True:
+        await asyncio.sleep(min(60, HTTP_SESSION_TTL))
+        cutoff = time.monotonic() - HTTP_SESSION_TTL
+        for session_id, session in list(http_sessions.items()):
+            if session.last_seen < cutoff and session.send_message is None and not session.in_flight:
+                del http_sessions[session_id]
+                logger.info(f"HTTP session {session_id} expired")
+
+
+async def serve_http(host, port):
+    """Serve many MCP clients over streamable HTTP from this process."""
+    server = await asyncio.start_server(handle_http_connection, host, port, limit=MAX_MESSAGE_BYTES)
+    expiry_task = asyncio.create_task(expire_http_sessions())
+    logger.info(f"Listening for MCP streamable HTTP on http://{host}:{port}{HTTP_PATH}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        expiry_task.cancel()
+
+
+async def main_async(transport=TRANSPORT, host=HTTP_HOST, port=HTTP_PORT, socket_path=DAEMON_SOCKET,
+                     rebuild_indices=REBUILD_INDICES):
+    """Async main loop to handle MCP protocol messages."""
+    logger.info("=" * 60)
+    logger.info("Graphiti-Memory MCP server starting...")
+    logger.info("=" * 60)
+    logger.info(f"JSON codec: {json_codec_name}")
+
+    global tool_call_semaphore, episode_semaphore, graphiti_ready, episode_journal, journal_backlog
+    tool_call_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+    episode_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EPISODES)
+    graphiti_ready = asyncio.Event()
+
+    if EPISODE_JOURNAL:
+        episode_journal = EpisodeJournal(EPISODE_JOURNAL)
+        journal_backlog = await episode_journal.open()
+        logger.info(f"Episode journal: {EPISODE_JOURNAL} ({len(journal_backlog)} pending)")
+
+    # Initialize Graphiti in the background so initialize/tools/list answer immediately,
+    # retrying until Neo4j is reachable
+    initialization_task = asyncio.create_task(supervise_graphiti(rebuild_indices))
+
+    if transport == "daemon":
+        # Let SIGTERM unwind normally so the socket file is removed
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        if transport == "http":
+            await serve_http(host, port)
+        elif transport == "daemon":
+            await serve_daemon(socket_path)
+        else:
+            await serve_stdio()
+    except asyncio.CancelledError:
+        logger.info("Server stopped")
+    finally:
+        initialization_task.cancel()
+        if episode_journal is not None:
+            await episode_journal.close()
+
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(
+        prog="graphiti-mcp-server",
+        description="MCP server for Graphiti knowledge graph operations",
+    )
+    parser.add_argument(
+        "--transport", choices=["stdio", "http"], default=TRANSPORT,
+        help="stdio serves one client; http serves many sessions from one process (default: %(default)s)",
+    )
+    parser.add_argument("--host", default=HTTP_HOST, help="HTTP bind address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=HTTP_PORT, help="HTTP port (default: %(default)s)")
+    parser.add_argument(
+        "--daemon", action="store_const", const="daemon", dest="transport",
+        help="serve graphiti-mcp-shim clients on a Unix domain socket",
+    )
+    parser.add_argument("--socket", default=DAEMON_SOCKET, help="daemon socket path (default: %(default)s)")
+    parser.add_argument(
+        "--rebuild-indices", action="store_true", default=REBUILD_INDICES,
+        help="rebuild indices and constraints even if the schema fingerprint matches",
+    )
+    return parser.parse_args(argv)
 
 
 def main():
     """Main entry point."""
+    args = parse_args()
     try:
-        asyncio.run(main_async())
+        asyncio.run(main_async(args.transport, args.host, args.port, args.socket, args.rebuild_indices))
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
     except Exception as e:
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Graphiti-Memory stdio shim
+
+Forwards newline-delimited JSON-RPC between an MCP client's stdin/stdout and a
+shared `graphiti-mcp-server --daemon` listening on a Unix domain socket.
+
+The shim deliberately imports nothing beyond the standard library, so it starts
+in milliseconds; every session shares the daemon's warm Graphiti client, Neo4j
+connection pool and ingestion workers.
+
+Environment Variables:
+- GRAPHITI_DAEMON_SOCKET: Socket path (defaults to graphiti-memory-<config hash>.sock in
+  $XDG_RUNTIME_DIR or ~/.cache/graphiti-memory, so shims with different
+  Neo4j/OpenAI/group settings never share a daemon)
+- GRAPHITI_SHIM_AUTOSTART: Start the daemon if it is not running (default: true)
+- GRAPHITI_SHIM_CONNECT_TIMEOUT: Seconds to wait for an autostarted daemon (default: 30)
+"""
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+AUTOSTART = os.environ.get('GRAPHITI_SHIM_AUTOSTART', 'true').lower() == 'true'
+CONNECT_TIMEOUT = float(os.environ.get('GRAPHITI_SHIM_CONNECT_TIMEOUT', '30'))
+
+# Settings an autostarted daemon inherits from its shim; each distinct
+# combination gets its own daemon and socket
+DAEMON_CONFIG_VARS = (
+    'NEO4J_URI',
+    'NEO4J_USER',
+    'NEO4J_PASSWORD',
+    'GRAPHITI_GROUP_ID',
+    'OPENAI_API_KEY',
+    'OPENAI_BASE_URL',
+    'OPENAI_MODEL',
+    'OPENAI_EMBEDDING_MODEL',
+)
+
+
+def config_fingerprint():
+    """Return a short hash of the connection-relevant environment."""
+    digest = hashlib.sha256()
+    for name in DAEMON_CONFIG_VARS:
+        digest.update(f"{name}={os.environ.get(name)!r}\0".encode())
+    return digest.hexdigest()[:16]
+
+
+def default_socket_path():
+    """Return the daemon socket path shared by the shim and the daemon."""
+    configured = os.environ.get('GRAPHITI_DAEMON_SOCKET')
+    if configured:
+        return configured
+    base = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'graphiti-memory'
+    )
+    return os.path.join(base, f'graphiti-memory-{config_fingerprint()}.sock')
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _spawn_daemon(path):
+    """Start a detached daemon that logs next to its socket."""
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    log_path = os.path.splitext(path)[0] + '-daemon.log'
+    with open(log_path, 'ab') as log_file:
+        subprocess.Popen(
+            [sys.executable, '-m', 'graphiti_memory.server', '--daemon', '--socket', path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=log_file,
+            start_new_session=True,
+        )
+
+
+def connect_to_daemon(path):
+    """Connect to the daemon, starting it first if allowed."""
+    try:
+        return _connect(path)
+    except OSError:
+        if not AUTOSTART:
+            raise
+
+    _spawn_daemon(path)
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            return _connect(path)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _forward_stdin(sock):
+    """Copy stdin to the daemon; half-close the socket at EOF."""
+    stdin = sys.stdin.buffer
+    try:
+        while True:
+            data = stdin.read1(65536)
+            if not data:
+                break
+            sock.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def _forward_socket(sock):
+    """Copy daemon output to stdout until the daemon closes the connection."""
+    stdout = sys.stdout.buffer
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        stdout.write(data)
+        stdout.flush()
+
+
+def main():
+    """Main entry point."""
+    path = default_socket_path()
+    try:
+        sock = connect_to_daemon(path)
+    except OSError as e:
+        sys.stderr.write(f"graphiti-mcp-shim: cannot reach daemon at {path}: {e}\n")
+        sys.exit(1)
+
+    threading.Thread(target=_forward_stdin, args=(sock,), daemon=True).start()
+    try:
+        _forward_socket(sock)
+    except (OSError, KeyboardInterrupt):
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()